@@ -0,0 +1,356 @@
+"""Local stand-in for the subset of the fandom MediaWiki api.php that the wiki cog uses,
+serving pages from a fixture corpus. Run from the `master` directory with
+`python -m benchmarks.api_server`, and point the bot at it by setting `BASE_API_URL` to
+e.g. `http://127.0.0.1:8080/api.php?`.
+
+Supported are `generator=categorymembers` (with `continue`), `pageids`/`titles` (with
+`redirects`), `prop=categories|redirects|revisions`, `prop=imageinfo` (every file exists,
+at a made-up url) and `list=recentchanges`. Pages can be
+edited through `POST /edit?pageid=...`, which bumps their revision and shows up in the
+recent changes feed, to exercise cache refreshes. Responses carry an ETag, and requests
+with a matching `If-None-Match` are answered with 304 Not Modified.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import random
+import urllib.parse
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Iterable, Optional
+from aiohttp import web
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+MAX_IDS = 50  # maximum number of pageids/titles per query, as on the real API
+# The kind of content served for pages listed under each top-level category, as keyed in
+# the recorded page contents.
+LISTING_KINDS = {
+    "Category:Battlesuits": "battlesuit",
+    "Category:Stigmata": "stigmata",
+    "Category:Weapons": "weapon",
+}
+
+
+@dataclass
+class Page:
+    pageid: int
+    title: str
+    categories: list[str]
+    redirects: dict[int, str]  # pageid to title of every redirect to this page
+    wikitext: str
+    revid: int = 1
+    listed_in: set[str] = field(default_factory=set)  # top-level categories
+
+
+class Corpus:
+    """All pages known to the server, along with the recent changes made to them.
+
+    Parameters:
+    -----------
+    pages: Iterable[:class:`Page`]
+        The pages in the corpus.
+    """
+
+    def __init__(self, pages: Iterable[Page]):
+        self.pages: dict[int, Page] = {}
+        self.titles: dict[str, Page] = {}
+        self.redirects: dict[str, Page] = {}
+        self.members: dict[str, list[Page]] = {}
+        self.changes: list[dict[str, Any]] = []  # newest first
+        for page in pages:
+            self.pages[page.pageid] = page
+            self.titles[page.title] = page
+            for redirect in page.redirects.values():
+                self.redirects[redirect] = page
+            for category in page.listed_in:
+                self.members.setdefault(category, []).append(page)
+
+        for members in self.members.values():
+            members.sort(key=lambda page: page.title)
+
+    @classmethod
+    def from_fixtures(cls, directory: str = FIXTURE_DIR, *, scale: int = 1) -> Corpus:
+        """Load a corpus from the recorded category listings and page contents in the
+        given directory. Pages without recorded content get that of a recorded page of
+        the same kind. With `scale` > 1, every page is repeated under a new title.
+        """
+        with open(os.path.join(directory, "categories.json"), encoding="utf-8") as file:
+            listings: dict[str, dict] = json.load(file)
+        with open(os.path.join(directory, "content.json"), encoding="utf-8") as file:
+            recorded: dict[str, dict] = json.load(file)
+
+        contents: dict[str, str] = {}
+        kinds: dict[str, str] = {}
+        for kind, response in recorded.items():
+            for raw in response["query"]["pages"].values():
+                contents[raw["title"]] = kinds[kind] = raw["revisions"][0]["slots"]["main"]["*"]
+
+        pages: dict[int, Page] = {}
+        for category, listing in listings.items():
+            for raw in listing["query"]["pages"].values():
+                page = pages.get(raw["pageid"])
+                if page is None:
+                    categories = [c["title"] for c in raw.get("categories", [])]
+                    page = pages[raw["pageid"]] = Page(
+                        pageid=raw["pageid"],
+                        title=raw["title"],
+                        categories=categories,
+                        redirects={r["pageid"]: r["title"] for r in raw.get("redirects", [])},
+                        wikitext=contents.get(raw["title"]) or kinds[LISTING_KINDS[category]],
+                    )
+                page.listed_in.add(category)
+
+        pageids = itertools.count(max(pages) + 1)
+        replicas = [
+            Page(
+                pageid=next(pageids),
+                title=f"Replica {i} {page.title}",
+                categories=page.categories,
+                redirects={next(pageids): f"Replica {i} {r}" for r in page.redirects.values()},
+                wikitext=page.wikitext,
+                listed_in=set(page.listed_in),
+            )
+            for i in range(1, scale)
+            for page in list(pages.values())
+        ]
+        return cls([*pages.values(), *replicas])
+
+    def resolve(self, title: str, *, redirects: bool) -> Optional[Page]:
+        page = self.titles.get(title)
+        if page is None and redirects:
+            page = self.redirects.get(title)
+        return page
+
+    def edit(self, page: Page) -> None:
+        """Make a new revision of a page, and add it to the recent changes."""
+        page.revid += 1
+        self.changes.insert(
+            0,
+            {
+                "type": "edit",
+                "ns": 0,
+                "title": page.title,
+                "pageid": page.pageid,
+                "revid": page.revid,
+                "old_revid": page.revid - 1,
+                "timestamp": datetime.utcnow().strftime(TIMESTAMP_FORMAT),
+            },
+        )
+
+
+class APIServer:
+    """Serves the corpus through api.php.
+
+    Parameters:
+    -----------
+    corpus: :class:`Corpus`
+        The pages to serve.
+    latency: :class:`float`
+        The number of seconds every response is delayed by.
+    jitter: :class:`float`
+        The maximum number of seconds randomly added to the latency.
+    max_limit: :class:`int`
+        The number of category members returned per request when asking for "max".
+        Lower this to force pagination through `continue`.
+    max_age: :class:`int`
+        The number of seconds clients may use a response without revalidating it.
+    """
+
+    def __init__(
+        self,
+        corpus: Corpus,
+        *,
+        latency: float = 0,
+        jitter: float = 0,
+        max_limit: int = 500,
+        max_age: int = 0,
+    ):
+        self.corpus = corpus
+        self.latency = latency
+        self.jitter = jitter
+        self.max_limit = max_limit
+        self.max_age = max_age
+        self.requests = 0
+        self.not_modified = 0
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api.php", self.handle_api)
+        app.router.add_post("/edit", self.handle_edit)
+        return app
+
+    async def handle_api(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        params = request.query
+        if params.get("action") != "query":
+            return self.error("badvalue", "Only action=query is supported.")
+        if params.get("list") == "recentchanges":
+            return self.respond(request, self.recent_changes(params))
+        if params.get("prop") == "imageinfo":
+            return self.respond(request, self.image_info(params))
+
+        query: dict[str, Any] = {}
+        result: dict[str, Any] = {"batchcomplete": "", "query": query}
+        missing: list[dict[str, Any]] = []
+        if params.get("generator") == "categorymembers":
+            members = self.corpus.members.get(params.get("gcmtitle", ""), [])
+            offset = int(params.get("gcmcontinue", 0))
+            end = offset + self.limit(params.get("gcmlimit", "10"))
+            pages: list[Optional[Page]] = members[offset:end]
+            if end < len(members):
+                result["continue"] = {"gcmcontinue": str(end), "continue": "gcmcontinue||"}
+        elif "pageids" in params:
+            pageids = [int(pageid) for pageid in params["pageids"].split("|")][:MAX_IDS]
+            pages = [self.corpus.pages.get(pageid) for pageid in pageids]
+            missing = [{"pageid": pid, "missing": ""} for pid, p in zip(pageids, pages) if not p]
+        elif "titles" in params:
+            titles = params["titles"].split("|")[:MAX_IDS]
+            redirects = "redirects" in params
+            pages = [self.corpus.resolve(title, redirects=redirects) for title in titles]
+            missing = [{"ns": 0, "title": t, "missing": ""} for t, p in zip(titles, pages) if not p]
+            redirected = [
+                {"from": title, "to": page.title}
+                for title, page in zip(titles, pages)
+                if page is not None and page.title != title
+            ]
+            if redirected:
+                query["redirects"] = redirected
+        else:
+            return self.error("nopages", "No pages were requested.")
+
+        props = set(params.get("prop", "").split("|"))
+        query["pages"] = {
+            str(page.pageid): self.render(page, props, params) for page in pages if page
+        }
+        for i, page in enumerate(missing, 1):
+            query["pages"][str(page.get("pageid", -i))] = page
+
+        return self.respond(request, result)
+
+    async def handle_edit(self, request: web.Request) -> web.Response:
+        page = self.corpus.pages.get(int(request.query.get("pageid", 0)))
+        if page is None:
+            return self.error("nosuchpageid", "There is no page with that pageid.")
+        self.corpus.edit(page)
+        return web.json_response({"pageid": page.pageid, "revid": page.revid})
+
+    def respond(self, request: web.Request, data: dict[str, Any]) -> web.Response:
+        body = json.dumps(data).encode()
+        headers = {
+            "ETag": f'"{hashlib.sha1(body).hexdigest()}"',
+            "Cache-Control": f"max-age={self.max_age}, must-revalidate",
+        }
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            self.not_modified += 1
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    def limit(self, value: str) -> int:
+        return self.max_limit if value == "max" else min(int(value), self.max_limit)
+
+    def render(self, page: Page, props: set[str], params: dict[str, str]) -> dict[str, Any]:
+        rendered: dict[str, Any] = {"pageid": page.pageid, "ns": 0, "title": page.title}
+        if "categories" in props:
+            wanted = params.get("clcategories")
+            categories = [
+                {"ns": 14, "title": category}
+                for category in page.categories
+                if wanted is None or category in wanted.split("|")
+            ]
+            if categories:
+                rendered["categories"] = categories
+
+        if "redirects" in props and page.redirects:
+            rendered["redirects"] = [
+                {"pageid": pageid, "ns": 0, "title": title}
+                for pageid, title in page.redirects.items()
+            ]
+
+        if "revisions" in props:
+            rvprop = params.get("rvprop", "ids|timestamp|flags|comment|user").split("|")
+            revision: dict[str, Any] = {}
+            if "ids" in rvprop:
+                revision.update(revid=page.revid, parentid=page.revid - 1)
+            if "content" in rvprop:
+                revision["slots"] = {
+                    "main": {
+                        "contentmodel": "wikitext",
+                        "contentformat": "text/x-wiki",
+                        "*": page.wikitext,
+                    }
+                }
+            rendered["revisions"] = [revision]
+
+        return rendered
+
+    def recent_changes(self, params: dict[str, str]) -> dict[str, Any]:
+        end = params.get("rcend", "")
+        changes = [change for change in self.corpus.changes if change["timestamp"] >= end]
+        return {"batchcomplete": "", "query": {"recentchanges": changes}}
+
+    def image_info(self, params: dict[str, str]) -> dict[str, Any]:
+        pages: dict[str, Any] = {}
+        normalized = []
+        for title in params.get("titles", "").split("|")[:MAX_IDS]:
+            name = title.replace("_", " ")
+            if name != title:
+                normalized.append({"from": title, "to": name})
+            digest = hashlib.md5(name.encode()).hexdigest()
+            file = urllib.parse.quote(name.removeprefix("File:").replace(" ", "_"))
+            url = f"https://static.invalid/images/{digest[0]}/{digest[:2]}/{file}/revision/latest"
+            pageid = int(digest[:6], 16)
+            pages[str(pageid)] = {
+                "pageid": pageid,
+                "ns": 6,
+                "title": name,
+                "imagerepository": "local",
+                "imageinfo": [{"url": url}],
+            }
+
+        query: dict[str, Any] = {"pages": pages}
+        if normalized:
+            query["normalized"] = normalized
+        return {"batchcomplete": "", "query": query}
+
+    @staticmethod
+    def error(code: str, info: str) -> web.Response:
+        return web.json_response({"error": {"code": code, "info": info}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fixtures", default=FIXTURE_DIR, help="directory of the corpus")
+    parser.add_argument("--scale", type=int, default=1, help="number of copies of every page")
+    parser.add_argument("--latency", type=float, default=0, help="seconds per response")
+    parser.add_argument("--jitter", type=float, default=0, help="random extra seconds")
+    parser.add_argument("--max-limit", type=int, default=500, help="category members per page")
+    parser.add_argument("--max-age", type=int, default=0, help="seconds responses stay fresh")
+    args = parser.parse_args()
+
+    corpus = Corpus.from_fixtures(args.fixtures, scale=args.scale)
+    server = APIServer(
+        corpus,
+        latency=args.latency,
+        jitter=args.jitter,
+        max_limit=args.max_limit,
+        max_age=args.max_age,
+    )
+    print(f"Serving {len(corpus.pages)} pages at http://{args.host}:{args.port}/api.php")
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
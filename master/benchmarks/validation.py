@@ -0,0 +1,95 @@
+"""Measure the per-instance validation cost of the wiki models, for a battlesuit and for
+a full stigmata set. Run from the `master` directory with `python -m benchmarks.validation`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import timeit
+from models.wiki import BattlesuitModel, ContentResponseModel, StigmataSetModel
+
+BATTLESUIT_DATA = {
+    "type": "MECH",
+    "rank": "S",
+    "battlesuit": "Herrscher of Thunder",
+    "character": "[[Raiden Mei]]",
+    "profile": "The power of the '''Herrscher of Thunder''' awakened within Mei.<br>"
+    "She fights for everyone's future.",
+    "core_strengths": "Lightning DMG, Burst, Time Mastery",
+    "augment": "",
+    "obtain": "Supply: [[Focused Supply]]<br />Exchange: [[Asterite]] shop",
+    "beginnerWeapon": "Thunderbreaker",
+    "beginnerTop": "Thales (T)",
+    "beginnerMiddle": "Thales (M)",
+    "beginnerBottom": "Thales (B)",
+    "economicWeapon": "Thunderbreaker",
+    "economicTop": "Tesla Zeus (T)",
+    "economicMiddle": "Thales (M)",
+    "economicBottom": "Tesla Zeus (B)",
+    "advancedWeapon": "Domain of Sanction",
+    "advancedTop": "Dante (T)",
+    "advancedMiddle": "Dante (M)",
+    "advancedBottom": "Dante (B)",
+    "formation1": "Herrscher of Reason",
+    "reason1": 'Provides <span class="color-blue">Time Fracture</span> support.',
+    "formation2": "Lone Destruction",
+    "reason2": "'''Lightning''' team member; see [[Teams#Lightning|teams]].",
+}
+STIGMATA_DATA = {
+    "name": "Thales",
+    "rarity": "4",
+    "Teffect": "Total Lightning DMG +20%.<br>After an [[Ultimate]], gain "
+    '<span class="increase">15%</span> Lightning DMG for 8s.',
+    "THP": "462",
+    "TATK": "0",
+    "TDEF": "0",
+    "TCRT": "18",
+    "Meffect": "Weapon Skill DMG +'''25%'''.",
+    "MHP": "0",
+    "MATK": "77",
+    "MDEF": "31",
+    "MCRT": "0",
+    "Beffect": "Total DMG +15% for Lightning Battlesuits.",
+    "BHP": "0",
+    "BATK": "0",
+    "BDEF": "64",
+    "BCRT": "6",
+    "2set": "The Founder",
+    "2effect": 'Lightning DMG +20%. <span class="color-orange">Passive:</span> Attacks '
+    "ignore 10% resistance.",
+    "3set": "Blessing of the Seas",
+    "3effect": "After [[Combo]] 30, deal 600% ATK of Lightning DMG.<br/>\nCD: 5s",
+}
+
+
+def content(title: str, data: dict[str, str]) -> ContentResponseModel:
+    page = {"pageid": 1, "title": title, "revid": 1, "wikitext": "", "data": data}
+    return ContentResponseModel.from_parsed([page])
+
+
+def benchmark(name: str, func, number: int, repeat: int) -> None:
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print(f"{name:<16} {best * 1e6:8.1f} µs per instance")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=1000, help="instances per run")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="number of runs")
+    args = parser.parse_args()
+
+    battlesuit = content("Herrscher of Thunder", BATTLESUIT_DATA)
+    stigmata = content("Thales (4★)", STIGMATA_DATA)
+    stigs = dict.fromkeys(("T", "M", "B"), "Thales")
+
+    benchmark("BattlesuitModel", lambda: BattlesuitModel(battlesuit), args.number, args.repeat)
+    benchmark(
+        "StigmataSetModel",
+        lambda: StigmataSetModel(stigs=stigs, content=stigmata),
+        args.number,
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
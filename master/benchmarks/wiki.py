@@ -0,0 +1,174 @@
+"""Time every stage of the /wiki pipeline against recorded API responses, without touching
+the network. Run from the `master` directory with `python -m benchmarks.wiki`.
+
+Results are written as JSON, such that runs on different commits can be compared.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime
+from typing import Any, Callable
+from cogs.mihoyo.wiki import create_model
+from models.wiki import (
+    BattlesuitModel,
+    ContentResponseModel,
+    GenericWikiModel,
+    QueryResponse,
+    StigmataSetModel,
+    WeaponModel,
+    strip_suffix_from_title,
+)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+CONTENT_MODELS: dict[str, type[GenericWikiModel]] = {
+    "battlesuit": BattlesuitModel,
+    "stigmata": StigmataSetModel,
+    "weapon": WeaponModel,
+}
+FUZZY_QUERIES = ("herscher of thnder", "thales", "domian of sanctoin", "elysia", "key of")
+
+
+def load_fixture(name: str) -> Any:
+    with open(os.path.join(FIXTURE_DIR, f"{name}.json"), encoding="utf-8") as fixture_file:
+        return json.load(fixture_file)
+
+
+def build_index(categories: dict[str, dict]) -> QueryResponse:
+    """Build the wiki index the same way the wiki cog does after a full crawl."""
+    result, *others = (QueryResponse(**response) for response in categories.values())
+    for other in others:
+        result.update(other)
+    return result
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Suite:
+    """Collects the timings of all benchmarks in a run.
+
+    Parameters:
+    -----------
+    number: :class:`int`
+        The number of times each benchmark is run per repeat.
+    repeat: :class:`int`
+        The number of repeats, of which the best and median are reported.
+    """
+
+    def __init__(self, number: int, repeat: int):
+        self.number = number
+        self.repeat = repeat
+        self.results: list[dict[str, Any]] = []
+
+    def run(self, name: str, func: Callable[[], Any], *, operations: int = 1) -> None:
+        """Time `func`, which performs `operations` operations per call, and record the
+        time per operation in microseconds.
+        """
+        times = timeit.repeat(func, number=self.number, repeat=self.repeat)
+        per_operation = [t / self.number / operations * 1e6 for t in times]
+        self.results.append(
+            {
+                "name": name,
+                "operations": self.number * operations,
+                "best_us": round(min(per_operation), 3),
+                "median_us": round(statistics.median(per_operation), 3),
+            }
+        )
+        print(f"{name:<36} {min(per_operation):12.3f} µs", file=sys.stderr)
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "number": self.number,
+            "repeat": self.repeat,
+            "results": self.results,
+        }
+
+
+def run_benchmarks(suite: Suite) -> None:
+    categories = load_fixture("categories")
+    content = load_fixture("content")
+
+    # Index
+    suite.run("QueryResponse", lambda: build_index(categories))
+    index = build_index(categories)
+    names = [name for page in index.pages.values() for name in (page.title, *page.aliases)]
+    suite.run(
+        "QueryResponse.get", lambda: [index.get(name) for name in names], operations=len(names)
+    )
+    suite.run(
+        "QueryResponse.fuzzy",
+        lambda: [index.fuzzy(query) for query in FUZZY_QUERIES],
+        operations=len(FUZZY_QUERIES),
+    )
+    suite.run(
+        "QueryResponse.search",
+        lambda: [index.search(query) for query in FUZZY_QUERIES],
+        operations=len(FUZZY_QUERIES),
+    )
+
+    # Content
+    for kind, model_type in CONTENT_MODELS.items():
+        response = content[kind]
+        suite.run(f"ContentPage.{kind}", lambda: ContentResponseModel(**response))
+
+        parsed = ContentResponseModel(**response)
+        title = strip_suffix_from_title(parsed.pages[0].title)
+        suite.run(model_type.__name__, lambda: create_model(model_type, title, parsed))
+
+        model = create_model(model_type, title, parsed)
+        suite.run(f"{model_type.__name__}.to_embed", model.to_embed)
+
+
+def compare(report: dict[str, Any], baseline: dict[str, Any]) -> None:
+    """Print how the best time of every benchmark changed relative to a previous run."""
+    previous = {result["name"]: result["best_us"] for result in baseline["results"]}
+    print(f"\nCompared to {baseline.get('revision') or 'baseline'}:", file=sys.stderr)
+    for result in report["results"]:
+        before = previous.get(result["name"])
+        if before:
+            change = (result["best_us"] / before - 1) * 100
+            print(f"{result['name']:<36} {change:+11.1f} %", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=100, help="calls per repeat")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="number of repeats")
+    parser.add_argument("-o", "--output", help="file to write the results to, instead of stdout")
+    parser.add_argument("-b", "--baseline", help="results of a previous run to compare against")
+    args = parser.parse_args()
+
+    suite = Suite(args.number, args.repeat)
+    run_benchmarks(suite)
+
+    report = suite.report()
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            compare(report, json.load(baseline_file))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
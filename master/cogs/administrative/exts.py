@@ -3,6 +3,7 @@ from disnake.ext import commands
 
 import traceback
 from utils.bot import CustomBot
+from utils.helpers import cached_autocomplete, filter_choices
 
 
 class Extension_Manager(commands.Cog):
@@ -42,6 +43,7 @@ class Extension_Manager(commands.Cog):
     @reload_slash.autocomplete("extension")
     @load_slash.autocomplete("extension")
     @unload_slash.autocomplete("extension")
+    @cached_autocomplete(scope=lambda cog, inter: tuple(cog.bot.extensions), refine=filter_choices)
     async def ext_autocomp(self, inter: Interaction, inp: str):
         return [ext for ext in self.bot.extensions if inp.lower() in ext.lower()]
 
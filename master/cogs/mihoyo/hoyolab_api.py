@@ -18,6 +18,7 @@ from typing import Optional
 from models.hoyolab import CookieModel, DiscordUserDataModel, HoyolabAccountModel
 from pydantic import ValidationError
 from utils.bot import CustomBot
+from utils.helpers import cached_autocomplete, filter_choices
 
 from .__hoyolab_utils import Hoyolab_API, ValidGame
 from .__hoyolab_utils.exceptions import AlreadySigned, FirstSign, HoyolabAPIError
@@ -309,7 +310,16 @@ class HoyolabApiCog(commands.Cog):
         await user.commit()
         await inter.edit_original_message(embed=result.embed)
 
+    def _signin_autocomp_scope(self, inter: Interaction):
+        user = disnake.utils.get(self.user_cache, discord_id=inter.author.id)
+        if user is None or not user.hoyolab:
+            return inter.author.id, ()
+        return inter.author.id, tuple(
+            (account.name, tuple(account.games)) for account in user.hoyolab.accounts
+        )
+
     @hoyo_signin.autocomplete("accounts")
+    @cached_autocomplete(scope=_signin_autocomp_scope, refine=filter_choices)
     async def hoyo_claim_account_autocomp(self, inter: Interaction, inp: str):
         user = disnake.utils.get(self.user_cache, discord_id=inter.author.id)
         return [
@@ -317,6 +327,7 @@ class HoyolabApiCog(commands.Cog):
         ]
 
     @hoyo_signin.autocomplete("games")
+    @cached_autocomplete(scope=_signin_autocomp_scope)
     async def hoyo_claim_game_autocomp(self, inter: Interaction, inp: str, *, account=None):
         if account:
             user = disnake.utils.get(self.user_cache, discord_id=inter.author.id)
@@ -1,25 +1,200 @@
 from __future__ import annotations
 
 from disnake import ApplicationCommandInteraction as Interaction
-from disnake.ext import commands
+from disnake import Embed
+from disnake.ext import commands, tasks
+from disnake.ext.commands import Param
 
-from typing import Callable, Type, TypeVar
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Coroutine, Iterable, Optional, Type, TypeVar
+from models.compare import compare_embed
+from models.recommendations import (
+    RecommendationIndex,
+    Recommender,
+    battlesuit_recommenders,
+    recommended_by,
+)
+from models.stats import StatQuery, StatRow, StatTable, stat_query_embed, stat_rows
 from models.wiki import QueryPage  # TODO: remove
 from models.wiki import (
     BattlesuitModel,
+    ContentPage,
     ContentResponseModel,
+    GenericWikiModel,
+    ImageInfoResponse,
     QueryResponse,
+    RecentChangesResponse,
+    RevisionsResponse,
     StigmataSetModel,
+    StigSlot,
     ValidCategory,
     WeaponModel,
+    category_mask,
+    image_file,
+    strip_suffix_from_title,
 )
 from utils.bot import CustomBot
+from utils.classes import Codeblock, LRUCache, TTLCache
+from utils.helpers import MAIN_DIR, cached_autocomplete, chunked
+from utils.http_cache import ResponseCache
+from utils.scheduler import Priority, RequestScheduler
+
+logger = logging.getLogger("wiki")
 
 BASE_WIKI_URL = "https://honkaiimpact3.fandom.com/"
-BASE_API_URL = "https://honkaiimpact3.fandom.com/api.php?"
+BASE_API_URL = os.getenv("BASE_API_URL", "https://honkaiimpact3.fandom.com/api.php?")
+
+WIKI_SNAPSHOT_PATH = os.getenv(
+    "WIKI_SNAPSHOT_PATH", os.path.join(MAIN_DIR, "data", "wiki_index.json")
+)
+WIKI_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+# Fandom only keeps recent changes around for a limited time; any snapshot older than
+# this cannot be reliably brought up to date and is rebuilt from scratch instead.
+WIKI_SNAPSHOT_MAX_AGE = timedelta(days=30)
+WIKI_CATEGORIES = ("Category:Stigmata", "Category:Battlesuits", "Category:Weapons")
+WIKI_MAX_BATCH = 50  # maximum number of titles/pageids per API query
+WIKI_STAT_TABLE = bool(int(os.getenv("WIKI_STAT_TABLE", 1)))  # whether to enable filter queries
+WIKI_STAT_RESULTS = 15  # maximum number of results shown for a filter query
+# whether to index which battlesuits recommend every weapon, stigmata set and battlesuit
+WIKI_RECOMMENDATION_INDEX = bool(int(os.getenv("WIKI_RECOMMENDATION_INDEX", 1)))
+# Seconds to wait for the direct urls of images before rendering with redirect urls instead
+WIKI_IMAGE_TIMEOUT = 1.5
+WIKI_CONTENT_CACHE_SIZE = int(os.getenv("WIKI_CONTENT_CACHE_SIZE", 4096))  # pages
+WIKI_CONTENT_CACHE_TTL = int(os.getenv("WIKI_CONTENT_CACHE_TTL", 24 * 60 * 60))  # seconds
+WIKI_CONTENT_REVALIDATE_AFTER = 10 * 60  # seconds before a cached page's revision is rechecked
+WIKI_EMBED_CACHE_SIZE = int(os.getenv("WIKI_EMBED_CACHE_SIZE", 256))  # rendered pages
+WIKI_AUTOCOMPLETE_LIMIT = 20
+WIKI_AUTOCOMPLETE_MIN_MATCHES = 5  # minimum number of substring matches before going fuzzy
+WIKI_CRAWL_CONCURRENCY = int(os.getenv("WIKI_CRAWL_CONCURRENCY", 4))  # max concurrent requests
+WIKI_REQUEST_RATE = float(os.getenv("WIKI_REQUEST_RATE", 5))  # requests per second; 0 for no limit
+WIKI_REQUEST_BURST = int(os.getenv("WIKI_REQUEST_BURST", 10))  # requests at once after a lull
+WIKI_WARMUP = bool(int(os.getenv("WIKI_WARMUP", 0)))  # whether to preload all content pages
+WIKI_WARMUP_INTERVAL = float(os.getenv("WIKI_WARMUP_INTERVAL", 6))  # hours
+WIKI_WARMUP_BATCH_DELAY = 1  # seconds between warm-up requests, to leave room for users
+# Number of worker processes that parse page content and render embeds off the event loop.
+# With 0, everything is parsed inline instead, which is mainly useful for testing.
+WIKI_PARSER_PROCESSES = int(os.getenv("WIKI_PARSER_PROCESSES", 2))
+# Directory that API responses are cached in across restarts; empty to only cache in memory.
+WIKI_HTTP_CACHE_DIR = os.getenv("WIKI_HTTP_CACHE_DIR", os.path.join(MAIN_DIR, "data", "http_cache"))
+WIKI_HTTP_CACHE_SIZE = int(os.getenv("WIKI_HTTP_CACHE_SIZE", 512))  # responses kept in memory
+WIKI_HTTP_CACHE_FILES = int(os.getenv("WIKI_HTTP_CACHE_FILES", 4096))  # responses kept on disk
+WIKI_HTTP_CACHE_MAX_AGE = float(os.getenv("WIKI_HTTP_CACHE_MAX_AGE", 7))  # days kept on disk
+
+
+# Bitmasks of the categories that determine how a page is displayed
+BATTLESUIT_CATEGORIES = category_mask(
+    {
+        ValidCategory.PSY,
+        ValidCategory.BIO,
+        ValidCategory.MECH,
+        ValidCategory.QUA,
+        ValidCategory.IMG,
+    }
+)
+STIGMATA_CATEGORIES = category_mask(
+    {
+        ValidCategory.STIGMA1,
+        ValidCategory.STIGMA2,
+        ValidCategory.STIGMA3,
+        ValidCategory.STIGMA4,
+        ValidCategory.STIGMA5,
+    }
+)
+WEAPON_CATEGORIES = category_mask(
+    {
+        ValidCategory.PISTOL,
+        ValidCategory.KATANA,
+        ValidCategory.CANNON,
+        ValidCategory.GREATSWORD,
+        ValidCategory.CROSS,
+        ValidCategory.GAUNTLET,
+        ValidCategory.SCYTHE,
+        ValidCategory.LANCE,
+        ValidCategory.BOW,
+    }
+)
 
 
 ResponseModel = TypeVar("ResponseModel")
+WikiModel = TypeVar("WikiModel", bound=GenericWikiModel)
+T = TypeVar("T")
+
+
+# Parsing
+# These run in the parser pool, so they only take and return plain, picklable data.
+
+
+def parse_content(data: dict[str, Any]) -> list[dict[str, Any]]:
+    """Parse a raw content API response into a list of plain page dicts, which can be
+    turned back into a model through :meth:`ContentResponseModel.from_parsed`.
+    """
+    return [page.dict() for page in ContentResponseModel(**data).pages]
+
+
+def create_model(
+    model_type: Type[WikiModel], title: str, content: ContentResponseModel
+) -> WikiModel:
+    if model_type is BattlesuitModel:
+        return BattlesuitModel(content=content)
+    elif model_type is StigmataSetModel:
+        return StigmataSetModel(stigs=dict.fromkeys(("T", "M", "B"), title), content=content)
+    elif model_type is WeaponModel:
+        return WeaponModel(**content.highest_rarity_by_name(title).data)
+    raise TypeError(f"Cannot create a model of type {model_type.__name__}.")
+
+
+def render_content(
+    pages: list[dict[str, Any]],
+    model_type: Type[GenericWikiModel],
+    title: str,
+    recommenders: Iterable[Recommender] = (),
+) -> list[dict[str, Any]]:
+    """Validate parsed pages into a model of the given type, and render its embeds as
+    plain dicts, which can be turned back into embeds through :meth:`Embed.from_dict`.
+    The battlesuits that recommend the page, if any, are listed below its embeds.
+    """
+    content = ContentResponseModel.from_parsed(pages)
+    rendered = [embed.to_dict() for embed in create_model(model_type, title, content).to_embed()]
+    field = recommended_by(recommenders)
+    if field is not None and rendered:
+        rendered[-1].setdefault("fields", []).append(field)
+    return rendered
+
+
+def render_build(pages: list[dict[str, Any]], stigs: dict[str, str]) -> list[dict[str, Any]]:
+    """Render a stigmata build of the given title for every slot, from parsed pages that
+    include all of them, like :func:`render_content`.
+    """
+    content = ContentResponseModel.from_parsed(pages)
+    return [embed.to_dict() for embed in StigmataSetModel(stigs=stigs, content=content).to_embed()]
+
+
+def parse_stat_rows(
+    pages: list[tuple[str, dict[str, Any]]],
+) -> dict[int, tuple[int, list[StatRow]]]:
+    """Validate pages of the given kinds into rows of the stat table, by pageid along
+    with the revision they were made from.
+    """
+    return {page["pageid"]: (page["revid"], stat_rows(kind, page["data"])) for kind, page in pages}
+
+
+def parse_recommenders(
+    pages: list[dict[str, Any]],
+) -> dict[int, tuple[int, list[Recommender]]]:
+    """Validate battlesuit pages into the items they recommend, by pageid along with the
+    revision they were taken from.
+    """
+    return {page["pageid"]: (page["revid"], battlesuit_recommenders(page)) for page in pages}
+
+
+def parse_model(model_type: Type[WikiModel], title: str, pages: list[dict[str, Any]]) -> WikiModel:
+    """Validate parsed pages into a model of the given type."""
+    return create_model(model_type, title, ContentResponseModel.from_parsed(pages))
 
 
 # Cog
@@ -28,134 +203,891 @@ ResponseModel = TypeVar("ResponseModel")
 class WikiCog(commands.Cog):
     def __init__(self, bot: CustomBot):
         self.bot = bot
+        self.wiki_timestamp: Optional[str] = None
+        self.scheduler = RequestScheduler(
+            WIKI_REQUEST_RATE, burst=WIKI_REQUEST_BURST, concurrency=WIKI_CRAWL_CONCURRENCY
+        )
+        self.http_cache = ResponseCache(
+            WIKI_HTTP_CACHE_DIR or None,
+            WIKI_HTTP_CACHE_SIZE,
+            max_files=WIKI_HTTP_CACHE_FILES,
+            max_age=WIKI_HTTP_CACHE_MAX_AGE * 24 * 60 * 60,
+        )
+        self.content_cache: TTLCache[int, ContentPage] = TTLCache(
+            WIKI_CONTENT_CACHE_SIZE, WIKI_CONTENT_CACHE_TTL
+        )
+        self.embed_cache: LRUCache[tuple, list[Embed]] = LRUCache(WIKI_EMBED_CACHE_SIZE)
+        self.image_urls: dict[str, str] = {}  # file name to direct url
+        self.stat_table = StatTable()
+        self._stat_table_lock = asyncio.Lock()
+        self.recommendation_index = RecommendationIndex()
+        self._recommendation_index_lock = asyncio.Lock()
+        self._missing_images: set[str] = set()
+        self._revalidating: set[int] = set()
+        self._background_tasks: set[asyncio.Task] = set()
+        # API requests and their priority, by their parameters
+        self._in_flight: dict[tuple, tuple[asyncio.Task, Priority]] = {}
+        self.parser_pool: Optional[ProcessPoolExecutor] = (
+            ProcessPoolExecutor(WIKI_PARSER_PROCESSES) if WIKI_PARSER_PROCESSES > 0 else None
+        )
+        # Jobs that aren't interactive may not occupy the last worker, such that renders
+        # for users never queue up behind bulk parsing.
+        self._background_parsing = asyncio.Semaphore(max(WIKI_PARSER_PROCESSES - 1, 1))
 
     async def cog_load(self):
         await self.bot.wait_until_ready()
         print("loading")
-        await self.populate_wiki_cache()
+        if self.load_wiki_snapshot():
+            await self.refresh_wiki_cache()
+        else:
+            await self.populate_wiki_cache()
+
+        if WIKI_WARMUP and not self.content_warmer.is_running():
+            self.content_warmer.start()
 
         print("dunzo'd")
 
-    async def populate_wiki_cache(self) -> None:
-        params = {
+    def cog_unload(self):
+        if self.content_warmer.is_running():
+            self.content_warmer.cancel()
+        for task in (*self._background_tasks, *(task for task, _ in self._in_flight.values())):
+            task.cancel()
+        if self.parser_pool is not None:
+            self.parser_pool.shutdown(wait=False, cancel_futures=True)
+
+    def run_in_background(self, coro: Coroutine) -> asyncio.Task:
+        """Run a coroutine as a task that is kept alive until it finishes, or until the
+        cog is unloaded.
+        """
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    async def run_in_parser_pool(
+        self,
+        func: Callable[..., T],
+        *args: Any,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> T:
+        """Run a CPU-bound parsing function in the parser pool, such that it doesn't block
+        the event loop. Runs it inline instead if the pool is disabled. Jobs that aren't
+        interactive wait for one of a limited number of slots before entering the pool.
+        """
+        if self.parser_pool is None:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        if priority is Priority.INTERACTIVE:
+            return await loop.run_in_executor(self.parser_pool, func, *args)
+        async with self._background_parsing:
+            return await loop.run_in_executor(self.parser_pool, func, *args)
+
+    @property
+    def index_params(self) -> dict[str, str]:
+        """Base parameters for any query that feeds into the wiki index."""
+        return {
             "action": "query",
             "format": "json",
             "prop": "categories|redirects",
-            "generator": "categorymembers",
             "cllimit": "max",
             "clcategories": "|".join(cat.value for cat in ValidCategory),
             "rdprop": "title",
             "rdlimit": "max",
-            "gcmtitle": "Category:Stigmata",
-            "gcmlimit": "max",
         }
 
-        for i, cat in enumerate(["Category:Stigmata", "Category:Battlesuits", "Category:Weapons"]):
-            _params = params.copy()
-            _params.update(gcmtitle=cat)
-            if not i:
-                result = await self.API_request(_params, QueryResponse)
-            else:
-                result.update(await self.API_request(_params, QueryResponse))
+    async def populate_wiki_cache(self) -> None:
+        timestamp = datetime.utcnow().strftime(WIKI_TIMESTAMP_FORMAT)
+        params = self.index_params
+        params.update(generator="categorymembers", gcmlimit="max")
+
+        result = QueryResponse(query={"pages": {}})
+        for response in await asyncio.gather(
+            *(
+                self.API_request(
+                    {**params, "gcmtitle": cat}, QueryResponse, priority=Priority.REFRESH
+                )
+                for cat in WIKI_CATEGORIES
+            )
+        ):
+            result.update(response)
 
         self.bot.wiki_cache = result
+        self.wiki_timestamp = timestamp
+        self._missing_images.clear()  # Give files that were since uploaded another chance
+        self.save_wiki_snapshot()
+        if WIKI_STAT_TABLE:
+            self.run_in_background(self.update_stat_table())
+        if WIKI_RECOMMENDATION_INDEX:
+            self.run_in_background(self.update_recommendation_index())
+
+    async def refresh_wiki_cache(self) -> None:
+        """Bring the wiki cache up to date by only refetching the pages that were changed
+        since the cache was last updated, as reported by the wiki's recent changes feed.
+        Falls back to a full crawl in case the cache is too old for this to be reliable.
+        """
+        if self.wiki_timestamp is None:
+            return await self.populate_wiki_cache()
+
+        last_update = datetime.strptime(self.wiki_timestamp, WIKI_TIMESTAMP_FORMAT)
+        if datetime.utcnow() - last_update > WIKI_SNAPSHOT_MAX_AGE:
+            return await self.populate_wiki_cache()
+
+        timestamp = datetime.utcnow().strftime(WIKI_TIMESTAMP_FORMAT)
+        rc_params = {
+            "action": "query",
+            "format": "json",
+            "list": "recentchanges",
+            "rcend": self.wiki_timestamp,
+            "rcprop": "title|ids|timestamp|loginfo",
+            "rctype": "edit|new|log",
+            "rcnamespace": "0",
+            "rclimit": "max",
+        }
+        changes = await self.API_request(
+            rc_params, RecentChangesResponse, priority=Priority.REFRESH
+        )
+
+        # Pages that were already indexed are refetched through all of their pageids
+        # and replace their old entries, such that deleted pages and removed categories
+        # disappear. Titles that aren't indexed yet may be new pages or new redirects.
+        # Old entries are only dropped once the refetch succeeded, such that they keep
+        # resolving in the meantime, and the index is left untouched if it fails.
+        cache: QueryResponse = self.bot.wiki_cache
+        stale: dict[str, QueryPage] = {}
+        pageids: set[str] = set()
+        titles: set[str] = set()
+        for title in changes.titles:
+            page = cache.get(strip_suffix_from_title(title))
+            if page is None:
+                titles.add(title)
+            else:
+                pageids.update(page.pageids)
+                stale[page.title] = page
+
+        if pageids or titles:
+            refetched = await self.fetch_index_pages(pageids=pageids, titles=titles)
+            for page in stale.values():
+                cache.discard(page)
+            cache.update(refetched)
+
+        logger.info(
+            f"Refreshed wiki cache; {len(changes.changes)} changes "
+            f"since {self.wiki_timestamp}, {len(pageids) + len(titles)} pages refetched."
+        )
+        self.wiki_timestamp = timestamp
+        self._missing_images.clear()  # Give files that were since uploaded another chance
+        self.save_wiki_snapshot()
+        if WIKI_STAT_TABLE:
+            self.run_in_background(self.update_stat_table(pageids))
+        if WIKI_RECOMMENDATION_INDEX:
+            self.run_in_background(self.update_recommendation_index(pageids))
+
+    async def fetch_index_pages(
+        self,
+        *,
+        pageids: Iterable[str] = (),
+        titles: Iterable[str] = (),
+        priority: Priority = Priority.REFRESH,
+    ) -> QueryResponse:
+        """Fetch index entries for the given pageids and/or titles in as few requests
+        as possible. Redirects are resolved to their target pages.
+        """
+        result = QueryResponse(query={"pages": {}})
+        for key, values in (("pageids", pageids), ("titles", titles)):
+            for batch in chunked(sorted(values), WIKI_MAX_BATCH):
+                params = self.index_params
+                params.update(redirects="1")
+                params[key] = "|".join(batch)
+                result.update(await self.API_request(params, QueryResponse, priority=priority))
+
+        return result
+
+    def load_wiki_snapshot(self) -> bool:
+        """Load the wiki cache from the snapshot on disk. Returns whether this succeeded."""
+        try:
+            with open(WIKI_SNAPSHOT_PATH) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+            self.bot.wiki_cache = QueryResponse(**snapshot["index"])
+            self.wiki_timestamp = snapshot["timestamp"]
+            self.image_urls = snapshot.get("images", {})
+        except (OSError, ValueError, KeyError) as e:
+            logger.info(f"Could not load wiki snapshot from {WIKI_SNAPSHOT_PATH}: {e}")
+            return False
+
+        return True
+
+    def save_wiki_snapshot(self) -> None:
+        """Save the wiki cache to disk, such that it can be reloaded on the next startup."""
+        snapshot = {
+            "timestamp": self.wiki_timestamp,
+            "index": self.bot.wiki_cache.dump(),
+            "images": self.image_urls,
+        }
+
+        os.makedirs(os.path.dirname(WIKI_SNAPSHOT_PATH), exist_ok=True)
+        temp_path = WIKI_SNAPSHOT_PATH + ".tmp"
+        with open(temp_path, "w") as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(temp_path, WIKI_SNAPSHOT_PATH)
+
+    @property
+    def content_params(self) -> dict[str, str]:
+        """Base parameters for any query for the content of pages."""
+        return {
+            "action": "query",
+            "format": "json",
+            "prop": "revisions",
+            "rvprop": "content|ids",
+            "rvslots": "main",
+        }
+
+    def get_cached_content(self, pageids: Iterable[int | str]) -> Optional[ContentResponseModel]:
+        """Get the parsed content of the given pages from cache, or `None` if any of them
+        isn't cached. In case pages haven't been checked in a while, their revisions are
+        checked in the background.
+        """
+        pageids = sorted({int(pageid) for pageid in pageids})
+        cached = [self.content_cache.get(pageid) for pageid in pageids]
+        if not all(cached):
+            return None
+
+        stale = [
+            pageid
+            for pageid in pageids
+            if self.content_cache.age(pageid) > WIKI_CONTENT_REVALIDATE_AFTER
+            and pageid not in self._revalidating
+        ]
+        if stale:
+            self._revalidating.update(stale)
+            self.run_in_background(self.revalidate_content(stale))
+
+        return ContentResponseModel(pages=cached)
+
+    async def fetch_content(self, pageids: Iterable[int | str]) -> ContentResponseModel:
+        """Get the parsed content of the given pages, from cache if possible."""
+        content = self.get_cached_content(pageids)
+        if content is not None:
+            return content
+        return await self.load_content(pageids)
+
+    async def load_content(
+        self,
+        pageids: Iterable[int | str],
+        *,
+        delay: float = 0,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> ContentResponseModel:
+        """Fetch and parse the content of the given pages, bypassing the cache, and store
+        the results in the cache. Pages are requested in batches of up to 50, optionally
+        waiting `delay` seconds after each batch.
+        """
+        content = ContentResponseModel(pages=[])
+        for batch in chunked(sorted(set(map(str, pageids))), WIKI_MAX_BATCH):
+            params = self.content_params
+            params.update(pageids="|".join(batch))
+            response = await self.API_request(params, ContentResponseModel, priority=priority)
+            for page in response.pages:
+                self.content_cache[page.pageid] = page
+            content.update(response)
+
+            if delay:
+                await asyncio.sleep(delay)
+
+        return content
+
+    async def revalidate_content(
+        self,
+        pageids: list[int],
+        *,
+        delay: float = 0,
+        priority: Priority = Priority.BACKGROUND,
+    ) -> None:
+        """Check whether the cached content of the given pages is still up to date. Pages
+        with a new revision are refetched, pages that no longer exist are evicted.
+        """
+        try:
+            revisions = RevisionsResponse(query={"pages": {}})
+            for batch in chunked(pageids, WIKI_MAX_BATCH):
+                params = {"action": "query", "format": "json", "prop": "revisions"}
+                params.update(rvprop="ids", pageids="|".join(map(str, batch)))
+                revisions.update(
+                    await self.API_request(params, RevisionsResponse, priority=priority)
+                )
+                if delay:
+                    await asyncio.sleep(delay)
+
+            changed = []
+            for pageid in pageids:
+                cached = self.content_cache.get(pageid)
+                revid = revisions.revids.get(pageid)
+                if revid is None:
+                    self.content_cache.pop(pageid, None)
+                elif cached is None or cached.revid != revid:
+                    changed.append(pageid)
+                else:
+                    self.content_cache.touch(pageid)
+
+            if changed:
+                await self.load_content(changed, delay=delay, priority=priority)
+
+        except Exception:
+            logger.exception(f"Failed to revalidate pages {pageids}")
+        finally:
+            self._revalidating.difference_update(pageids)
+
+    async def update_stat_table(self, changed: Iterable[int | str] = ()) -> None:
+        """Bring the stat table up to date with the wiki index. Pages that are no longer
+        indexed are dropped, and pages that are new to the table or in `changed` are
+        (re)parsed. Content that isn't cached is loaded in the background.
+        """
+        async with self._stat_table_lock:
+            kinds: dict[int, str] = {}
+            for page in self.bot.wiki_cache.pages.values():
+                model_type = self.get_model_type(page)
+                if model_type is WeaponModel:
+                    kinds.update(dict.fromkeys(map(int, page.pageids), "weapon"))
+                elif model_type is StigmataSetModel:
+                    kinds.update(dict.fromkeys(map(int, page.pageids), "stigmata"))
+
+            self.stat_table.discard(self.stat_table.pageids - kinds.keys())
+            changed = {int(pageid) for pageid in changed}
+            stale = [
+                pageid
+                for pageid in kinds
+                if pageid in changed or self.stat_table.revision(pageid) is None
+            ]
+            if not stale:
+                return
+
+            try:
+                pages = await self.load_index_pages(stale, changed)
+                rows = await self.run_in_parser_pool(
+                    parse_stat_rows,
+                    [(kinds[page.pageid], page.dict()) for page in pages],
+                    priority=Priority.BACKGROUND,
+                )
+            except Exception:
+                logger.exception("Failed to update the stat table")
+                return
+
+            self.stat_table.update(rows)
+            logger.info(
+                f"Updated stat table; {len(rows)} pages parsed, {len(self.stat_table)} rows."
+            )
+
+    async def update_recommendation_index(self, changed: Iterable[int | str] = ()) -> None:
+        """Bring the recommendation index up to date with the wiki index, the same way as
+        :meth:`update_stat_table`, but for battlesuit pages.
+        """
+        async with self._recommendation_index_lock:
+            pageids: set[int] = set()
+            for page in self.bot.wiki_cache.pages.values():
+                if self.get_model_type(page) is BattlesuitModel:
+                    pageids.update(map(int, page.pageids))
+
+            index = self.recommendation_index
+            index.discard(index.pageids - pageids)
+            changed = {int(pageid) for pageid in changed}
+            stale = [
+                pageid
+                for pageid in sorted(pageids)
+                if pageid in changed or index.revision(pageid) is None
+            ]
+            if not stale:
+                return
+
+            try:
+                pages = await self.load_index_pages(stale, changed)
+                recommenders = await self.run_in_parser_pool(
+                    parse_recommenders,
+                    [page.dict() for page in pages],
+                    priority=Priority.BACKGROUND,
+                )
+            except Exception:
+                logger.exception("Failed to update the recommendation index")
+                return
+
+            index.update(recommenders)
+            logger.info(
+                f"Updated recommendation index; {len(recommenders)} battlesuits parsed, "
+                f"{len(index)} recommendations."
+            )
+
+    async def load_index_pages(self, pageids: list[int], changed: set[int]) -> list[ContentPage]:
+        """Get the content of pages for a background index. Pages are taken from cache
+        unless they are in `changed`; the rest are loaded at background priority.
+        """
+        pages = [self.content_cache.get(pageid) for pageid in pageids if pageid not in changed]
+        pages = [page for page in pages if page is not None]
+        missing = sorted(set(pageids) - {page.pageid for page in pages})
+        if missing:
+            content = await self.load_content(
+                missing, delay=WIKI_WARMUP_BATCH_DELAY, priority=Priority.BACKGROUND
+            )
+            pages.extend(content.pages)
+        return pages
+
+    @tasks.loop(hours=WIKI_WARMUP_INTERVAL)
+    async def content_warmer(self):
+        """Preload the content of every battlesuit, stigmata and weapon page in the wiki
+        index, such that users never have to wait on the wiki. Already cached pages are
+        only revalidated. Requests are spread out so as not to get in the way of users.
+        """
+        pageids: set[int] = set()
+        for page in self.bot.wiki_cache.pages.values():
+            if self.get_model_type(page) is not None:
+                pageids.update(map(int, page.pageids))
+
+        stale = [
+            pageid
+            for pageid in sorted(pageids - self._revalidating)
+            if pageid in self.content_cache
+        ]
+        missing = [pageid for pageid in pageids if pageid not in self.content_cache]
+
+        self._revalidating.update(stale)
+        await self.revalidate_content(stale, delay=WIKI_WARMUP_BATCH_DELAY)
+        try:
+            await self.load_content(
+                missing, delay=WIKI_WARMUP_BATCH_DELAY, priority=Priority.BACKGROUND
+            )
+        except Exception:
+            # Keep the loop alive; whatever is missing is picked up by the next run.
+            logger.exception("Failed to warm up wiki content cache")
+            return
+
+        logger.info(
+            f"Warmed up wiki content cache; {len(stale)} pages revalidated, "
+            f"{len(missing)} pages loaded."
+        )
+
+    async def _fetch_json(self, params: dict[str, str], priority: Priority) -> dict:
+        async with self.scheduler.request(priority):
+            return await self.http_cache.get_json(self.bot.session, BASE_API_URL, params)
 
     async def API_request(
         self,
         params: dict[str, str],
         response_model: Type[ResponseModel] | Callable[..., ResponseModel],
+        *,
+        priority: Priority = Priority.INTERACTIVE,
     ) -> ResponseModel:
-        async with self.bot.session.get(BASE_API_URL, params=params) as resp:
-            data = await resp.json()
-        result = response_model(**data)
+        """Make a request to the wiki API and parse the response into `response_model`.
+        Identical requests that are made while one is already in flight share its result
+        instead of making a request of their own, so the result must not be modified.
+        Requests are scheduled by `priority`; a request never waits on an identical
+        request of lower priority.
+        """
+        key = (response_model, *sorted(params.items()))
+        task, task_priority = self._in_flight.get(key, (None, None))
+        if task is None or priority < task_priority:
+            task = asyncio.create_task(self._API_request(params, response_model, priority))
+            self._in_flight[key] = (task, priority)
 
-        while "continue" in data:
-            _params = params.copy()
-            _params.update(data["continue"])
+            def forget(task: asyncio.Task) -> None:
+                if self._in_flight.get(key, (None,))[0] is task:
+                    del self._in_flight[key]
 
-            async with self.bot.session.get(BASE_API_URL, params=_params) as resp:
-                data = await resp.json()
-            result.update(response_model(**data))
+            task.add_done_callback(forget)
+        # Shielded, such that one caller giving up doesn't cancel the request for the others.
+        return await asyncio.shield(task)
 
-        return result
+    async def _API_request(
+        self,
+        params: dict[str, str],
+        response_model: Type[ResponseModel] | Callable[..., ResponseModel],
+        priority: Priority,
+    ) -> ResponseModel:
+        """Make a request to the wiki API and parse the response into `response_model`.
+        If the wiki responds with `continue` parameters, the next request is already
+        sent off before the current response is parsed, and all responses are merged
+        into one through `response_model.update`.
+        """
+        data = await self._fetch_json(params, priority)
+        result = None
+
+        while True:
+            next_request = None
+            if "continue" in data:
+                next_request = asyncio.create_task(
+                    self._fetch_json({**params, **data["continue"]}, priority)
+                )
+                await asyncio.sleep(0)  # Allow the request to be sent before parsing
+
+            try:
+                response = await self.parse_response(data, response_model, priority)
+            except BaseException:
+                if next_request:
+                    next_request.cancel()
+                raise
+
+            if result is None:
+                result = response
+            else:
+                result.update(response)
+
+            if next_request is None:
+                return result
+            data = await next_request
+
+    async def parse_response(
+        self,
+        data: dict[str, Any],
+        response_model: Type[ResponseModel] | Callable[..., ResponseModel],
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> ResponseModel:
+        """Parse an API response into `response_model`. Page content is parsed in the
+        parser pool, as this is by far the most expensive kind of response to parse.
+        """
+        if response_model is ContentResponseModel:
+            pages = await self.run_in_parser_pool(parse_content, data, priority=priority)
+            return ContentResponseModel.from_parsed(pages)
+        return response_model(**data)
 
     @commands.command(name="reloadwikicache")
-    async def _reloadwikicache(self, ctx):
-        await self.populate_wiki_cache()
+    async def _reloadwikicache(self, ctx, full: bool = False):
+        if full:
+            await self.populate_wiki_cache()
+        else:
+            await self.refresh_wiki_cache()
         print("reloaded wiki cache")
 
+    @commands.command(name="wikistats")
+    @commands.is_owner()
+    async def _wikistats(self, ctx):
+        cache = self.http_cache
+        await ctx.send(
+            Codeblock(
+                f"{self.scheduler.describe()}\n"
+                f"http cache: {cache.hits} hits, {cache.revalidations} revalidated, "
+                f"{cache.misses} misses",
+                lang="yaml",
+            )
+        )
+
     @commands.slash_command(
         name="wiki",
         guild_ids=[701039771157397526, 511630315039490076, 555270199402823682, 268046379085987840],
     )
     async def wiki(self, inter: Interaction, query: str):
-        await inter.response.defer()
         page: QueryPage = self.bot.wiki_cache.get(query)
+        if page is None:
+            return await self.query_stat_table(inter, query)
 
-        page_params = {
-            "action": "query",
-            "format": "json",
-            "prop": "revisions",
-            "pageids": page.pageid,
-            "rvprop": "content",
-            "rvslots": "main",
-        }
-        content = await self.API_request(page_params, ContentResponseModel)
-
-        if page.categories.intersection(
-            {
-                ValidCategory.PSY,
-                ValidCategory.BIO,
-                ValidCategory.MECH,
-                ValidCategory.QUA,
-                ValidCategory.IMG,
-            }
-        ):
-            wiki_result = BattlesuitModel(content=content)
-
-        elif page.categories.intersection(
-            {
-                ValidCategory.STIGMA1,
-                ValidCategory.STIGMA2,
-                ValidCategory.STIGMA3,
-                ValidCategory.STIGMA4,
-                ValidCategory.STIGMA5,
-            }
-        ):
-            wiki_result = StigmataSetModel(
-                stigs=dict.fromkeys(("T", "M", "B"), page.title), content=content
+        model_type = self.get_model_type(page)
+        if model_type is None:
+            return await inter.response.send_message(
+                "It appears this type of query hasn't been implemented yet. "
+                "Please check back soon:tm:. For now, have this "
+                f"[link]({BASE_WIKI_URL}?curid={page.pageid})."
             )
 
-        elif page.categories.intersection(
-            {
-                ValidCategory.PISTOL,
-                ValidCategory.KATANA,
-                ValidCategory.CANNON,
-                ValidCategory.GREATSWORD,
-                ValidCategory.CROSS,
-                ValidCategory.GAUNTLET,
-                ValidCategory.SCYTHE,
-                ValidCategory.LANCE,
-                ValidCategory.BOW,
-            }
-        ):
-            data = content.highest_rarity_by_name(page.title).data
-            wiki_result = WeaponModel(**data)
+        # The battlesuits that recommend the page, if any, are listed below its embeds.
+        recommenders = self.recommendation_index.get(page.title)
+        await self.send_embeds(
+            inter,
+            (model_type.__name__, page.title, recommenders),
+            page.pageids,
+            render_content,
+            model_type,
+            page.title,
+            recommenders,
+        )
 
-        else:
-            await inter.edit_original_message(
-                content="It appears this type of query hasn't been implemented yet. "
-                "Please check back soon:tm:. For now, have this "
-                f"[link]({BASE_WIKI_URL}?curid={page.pageid})."
+    async def query_stat_table(self, inter: Interaction, query: str):
+        """Answer a /wiki query that isn't the name of a page as a filter query on the stat
+        table, such as `5* lances sort:atk` or `stigmata crt>20 top`.
+        """
+        try:
+            stat_query = StatQuery.parse(query)
+        except ValueError as e:
+            return await inter.response.send_message(
+                f"There is no page called `{query}`, nor does it work as a filter query: {e}",
+                ephemeral=True,
             )
-            return
 
-        await inter.edit_original_message(embeds=wiki_result.to_embed())
+        if not WIKI_STAT_TABLE or not len(self.stat_table):
+            return await inter.response.send_message(
+                "Filter queries are not available yet. Please check back soon:tm:.",
+                ephemeral=True,
+            )
+
+        total, rows = self.stat_table.query(stat_query, WIKI_STAT_RESULTS)
+        await inter.response.send_message(embed=stat_query_embed(query, total, rows))
+
+    @commands.slash_command(
+        name="build",
+        guild_ids=[701039771157397526, 511630315039490076, 555270199402823682, 268046379085987840],
+    )
+    async def build(
+        self,
+        inter: Interaction,
+        top: str = Param(desc="The stigmata set to take the top stigma from."),
+        middle: str = Param(desc="The stigmata set to take the middle stigma from."),
+        bottom: str = Param(desc="The stigmata set to take the bottom stigma from."),
+    ):
+        stigs: dict[str, QueryPage] = {}
+        for slot, query in zip(StigSlot, (top, middle, bottom)):
+            page = self.bot.wiki_cache.get(query)
+            if page is None or self.get_model_type(page) is not StigmataSetModel:
+                return await inter.response.send_message(
+                    f"There is no stigmata set called `{query}`.", ephemeral=True
+                )
+            stigs[slot.value] = page
+
+        # All pages are fetched in one request, unless they are all cached already.
+        titles = {slot: page.title for slot, page in stigs.items()}
+        key = ("build", *titles.values())
+        pageids = {pageid for page in stigs.values() for pageid in page.pageids}
+        content = self.get_cached_content(pageids)
+        embeds = None if content is None else self.get_cached_embeds(key, content)
+        if embeds is not None:
+            return await inter.response.send_message(embeds=embeds)
+
+        await inter.response.defer()
+        if content is None:
+            content = await self.load_content(pageids)
+
+        for slot in StigSlot:
+            title = stigs[slot.value].title
+            try:
+                has_slot = f"{slot.value}effect" in content.highest_rarity_by_name(title).data
+            except KeyError:
+                has_slot = False
+            if not has_slot:
+                return await inter.edit_original_message(
+                    content=f"The `{title}` set has no {slot.name.lower()} stigma."
+                )
+
+        embeds = await self.render_cached(key, content, render_build, titles)
+        await inter.edit_original_message(embeds=embeds)
+
+    @commands.slash_command(
+        name="compare",
+        guild_ids=[701039771157397526, 511630315039490076, 555270199402823682, 268046379085987840],
+    )
+    async def compare(
+        self,
+        inter: Interaction,
+        first: str = Param(desc="The first weapon or battlesuit to compare."),
+        second: str = Param(desc="The second weapon or battlesuit to compare."),
+        third: Optional[str] = Param(None, desc="A third weapon or battlesuit to compare."),
+        fourth: Optional[str] = Param(None, desc="A fourth weapon or battlesuit to compare."),
+    ):
+        pages: list[QueryPage] = []
+        for query in filter(None, (first, second, third, fourth)):
+            page = self.bot.wiki_cache.get(query)
+            if page is None:
+                return await inter.response.send_message(
+                    f"There is no page called `{query}`.", ephemeral=True
+                )
+            pages.append(page)
+
+        model_types = {self.get_model_type(page) for page in pages}
+        model_type = model_types.pop()
+        if model_types or model_type not in (WeaponModel, BattlesuitModel):
+            return await inter.response.send_message(
+                "Only weapons can be compared with weapons, and battlesuits with battlesuits.",
+                ephemeral=True,
+            )
+
+        # All pages are fetched in one request, unless they are all cached already.
+        await self.send_embeds(
+            inter,
+            ("compare", model_type.__name__, *(page.title for page in pages)),
+            {pageid for page in pages for pageid in page.pageids},
+            self.render_comparison,
+            model_type,
+            [(page.title, sorted(map(int, page.pageids))) for page in pages],
+        )
+
+    def get_model_type(self, page: QueryPage) -> Optional[Type[GenericWikiModel]]:
+        """Get the type of model used to display a page, based on its categories."""
+        if page.category_mask & BATTLESUIT_CATEGORIES:
+            return BattlesuitModel
+        elif page.category_mask & STIGMATA_CATEGORIES:
+            return StigmataSetModel
+        elif page.category_mask & WEAPON_CATEGORIES:
+            return WeaponModel
+        return None
+
+    async def send_embeds(
+        self,
+        inter: Interaction,
+        key: tuple,
+        pageids: Iterable[int | str],
+        render: Callable[..., list[dict[str, Any]]],
+        *args: Any,
+    ) -> None:
+        """Respond with the embeds rendered from the given pages through
+        :meth:`render_cached`. Only embeds that are already cached are sent right away;
+        fetching, rendering and resolving images may take longer than Discord waits for a
+        response, so the response is deferred first otherwise.
+        """
+        content = self.get_cached_content(pageids)
+        embeds = None if content is None else self.get_cached_embeds(key, content)
+        if embeds is not None:
+            return await inter.response.send_message(embeds=embeds)
+
+        await inter.response.defer()
+        if content is None:
+            content = await self.load_content(pageids)
+        embeds = await self.render_cached(key, content, render, *args)
+        await inter.edit_original_message(embeds=embeds)
+
+    @staticmethod
+    def embed_key(key: tuple, content: ContentResponseModel) -> tuple:
+        """The key that embeds rendered from content are cached under, which includes the
+        revisions of its pages.
+        """
+        return (*key, tuple(sorted((p.pageid, p.revid) for p in content.pages)))
+
+    def get_cached_embeds(self, key: tuple, content: ContentResponseModel) -> Optional[list[Embed]]:
+        return self.embed_cache.get(self.embed_key(key, content))
+
+    async def render_cached(
+        self,
+        key: tuple,
+        content: ContentResponseModel,
+        render: Callable[..., list[dict[str, Any]] | Awaitable[list[dict[str, Any]]]],
+        *args: Any,
+    ) -> list[Embed]:
+        """Render content into embeds as dicts through `render(pages, *args)` in the parser
+        pool, or by awaiting it in case it is a coroutine function that makes use of the
+        pool itself, and resolve their images. Embeds are cached under `key` and the
+        revisions of the content, once all their images are resolved.
+        """
+        key = self.embed_key(key, content)
+        embeds = self.embed_cache.get(key)
+        if embeds is None:
+            pages = [p.dict() for p in content.pages]
+            if asyncio.iscoroutinefunction(render):
+                rendered = await render(pages, *args)
+            else:
+                rendered = await self.run_in_parser_pool(render, pages, *args)
+            resolved = await self.resolve_images(rendered)
+            embeds = [Embed.from_dict(embed) for embed in rendered]
+            if resolved:
+                self.embed_cache[key] = embeds
+        return embeds
+
+    async def render_comparison(
+        self,
+        pages: list[dict[str, Any]],
+        model_type: Type[GenericWikiModel],
+        items: list[tuple[str, list[int]]],
+    ) -> list[dict[str, Any]]:
+        """Validate every item, as a title along with the pageids of its pages, into a model
+        of the given type in a parser pool job of its own, such that they are parsed
+        concurrently, and render their comparison.
+        """
+        models = await asyncio.gather(
+            *(
+                self.run_in_parser_pool(
+                    parse_model, model_type, title, [p for p in pages if p["pageid"] in pageids]
+                )
+                for title, pageids in items
+            )
+        )
+        return [compare_embed(models).to_dict()]
+
+    async def resolve_images(self, rendered: list[dict[str, Any]]) -> bool:
+        """Point the images of rendered embeds directly at their files, instead of at the
+        wiki's file redirects, such that they load in one hop. Urls that aren't known yet
+        are fetched first, unless that takes too long. Returns whether all images were
+        resolved, apart from images of files that don't exist.
+        """
+        images: list[tuple[dict[str, Any], str, str]] = []
+        for embed in rendered:
+            for field, key in (("thumbnail", "url"), ("image", "url"), ("author", "icon_url")):
+                container = embed.get(field, {})
+                file = image_file(container.get(key, ""))
+                if file is not None:
+                    images.append((container, key, file))
+
+        resolved = True
+        unknown = {file for *_, file in images} - self.image_urls.keys() - self._missing_images
+        if unknown:
+            request = self.run_in_background(self.fetch_image_urls(unknown))
+            try:
+                await asyncio.wait_for(asyncio.shield(request), WIKI_IMAGE_TIMEOUT)
+            except asyncio.TimeoutError:
+                resolved = False  # The request carries on, for the next time
+            except Exception:
+                logger.exception(f"Failed to fetch image urls for {sorted(unknown)}")
+                resolved = False
+
+        for container, key, file in images:
+            url = self.image_urls.get(file)
+            if url is not None:
+                container[key] = url
+        return resolved
+
+    async def fetch_image_urls(
+        self, files: Iterable[str], *, priority: Priority = Priority.INTERACTIVE
+    ) -> None:
+        """Fetch the direct urls of the given files, in batches of up to 50. Files that
+        don't exist are remembered until the next refresh of the wiki cache.
+        """
+        for batch in chunked(sorted(files), WIKI_MAX_BATCH):
+            params = {
+                "action": "query",
+                "format": "json",
+                "prop": "imageinfo",
+                "iiprop": "url",
+                "redirects": "1",
+                "titles": "|".join(f"File:{file}" for file in batch),
+            }
+            response = await self.API_request(params, ImageInfoResponse, priority=priority)
+            for file in batch:
+                url = response.urls.get(f"File:{file}")
+                if url is None:
+                    self._missing_images.add(file)
+                else:
+                    self.image_urls[file] = url
+
+    def _refine_wiki_query(self, inp: str, cached: dict[str, str]) -> Optional[dict[str, str]]:
+        if len(cached) >= WIKI_AUTOCOMPLETE_LIMIT:
+            return None  # Results may have been cut off, so we cannot filter them.
+
+        matches = self.bot.wiki_cache.substring(inp, among=set(cached.values()))
+        if len(matches) < WIKI_AUTOCOMPLETE_MIN_MATCHES:
+            return None  # Needs fuzzy matching, which isn't restricted to substrings.
+        return matches
 
     @wiki.autocomplete("query")
+    @cached_autocomplete(
+        scope=lambda cog, inter: cog.bot.wiki_cache.version, refine=_refine_wiki_query
+    )
     async def wiki_query_autocomp(self, inter: Interaction, inp: str):
-        # TODO: Match by longest substring first; fuzzy only if no results are found.
-        return self.bot.wiki_cache.fuzzy(inp)
+        return self.bot.wiki_cache.search(
+            inp, WIKI_AUTOCOMPLETE_LIMIT, min_matches=WIKI_AUTOCOMPLETE_MIN_MATCHES
+        )
+
+    @build.autocomplete("top")
+    @build.autocomplete("middle")
+    @build.autocomplete("bottom")
+    @cached_autocomplete(scope=lambda cog, inter: cog.bot.wiki_cache.version)
+    async def build_autocomp(self, inter: Interaction, inp: str):
+        stigmata = [
+            page.title
+            for page in self.bot.wiki_cache.pages.values()
+            if self.get_model_type(page) is StigmataSetModel
+        ]
+        return self.bot.wiki_cache.substring(inp, WIKI_AUTOCOMPLETE_LIMIT, among=stigmata)
+
+    @compare.autocomplete("first")
+    @compare.autocomplete("second")
+    @compare.autocomplete("third")
+    @compare.autocomplete("fourth")
+    @cached_autocomplete(scope=lambda cog, inter: cog.bot.wiki_cache.version)
+    async def compare_autocomp(self, inter: Interaction, inp: str):
+        comparable = [
+            page.title
+            for page in self.bot.wiki_cache.pages.values()
+            if self.get_model_type(page) in (WeaponModel, BattlesuitModel)
+        ]
+        return self.bot.wiki_cache.substring(inp, WIKI_AUTOCOMPLETE_LIMIT, among=comparable)
 
 
 def setup(bot: CustomBot):
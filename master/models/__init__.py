@@ -1,2 +1,5 @@
+from .compare import *
 from .guilds import *
+from .recommendations import *
+from .stats import *
 from .wiki import *
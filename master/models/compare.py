@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from disnake.embeds import Embed
+
+import re
+from typing import Sequence
+from models.wiki import BattlesuitModel, WeaponModel
+
+__all__ = ("compare_embed",)
+
+COLUMN_WIDTH = 16  # characters per column of the comparison table, including spacing
+
+_MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+
+
+def _cell(value: object) -> str:
+    """Format a value as plain text that fits in a column of the table."""
+    text = _MARKDOWN_LINK.sub(r"\1", str(value)).replace("**", "").replace("\\", "") or "-"
+    if len(text) >= COLUMN_WIDTH:
+        text = text[: COLUMN_WIDTH - 2] + "…"
+    return text.ljust(COLUMN_WIDTH)
+
+
+def _table(names: Sequence[str], rows: Sequence[tuple[str, Sequence[object]]]) -> str:
+    """Lay out rows of values in a code block, with a column per compared item."""
+    label_width = max(len(label) for label, _ in rows) + 2
+    lines = [" " * label_width + "".join(_cell(name) for name in names)]
+    for label, values in rows:
+        lines.append(label.ljust(label_width) + "".join(_cell(value) for value in values))
+    return "```\n" + "\n".join(line.rstrip() for line in lines) + "\n```"
+
+
+def _weapon_comparison(weapons: Sequence[WeaponModel]) -> Embed:
+    names = [weapon.name.name for weapon in weapons]
+    embed = Embed(
+        title="Weapon comparison",
+        description=_table(
+            names,
+            [
+                ("Type", [weapon.type for weapon in weapons]),
+                ("Rarity", [f"{weapon.rarity}*" for weapon in weapons]),
+                ("ATK", [weapon.ATK for weapon in weapons]),
+                ("CRT", [weapon.CRT for weapon in weapons]),
+            ],
+        ),
+    )
+    for weapon in weapons:
+        skills = "\n".join(f"{skill.icon} {skill.name}" for skill in weapon.skills)
+        embed.add_field(name=weapon.name.name, value=skills or "No skills", inline=True)
+    return embed
+
+
+def _battlesuit_comparison(battlesuits: Sequence[BattlesuitModel]) -> Embed:
+    links = [battlesuit.battlesuit or battlesuit.augment for battlesuit in battlesuits]
+    embed = Embed(
+        title="Battlesuit comparison",
+        description=_table(
+            [link.name for link in links],
+            [
+                ("Type", [battlesuit.type.name for battlesuit in battlesuits]),
+                ("Rank", [battlesuit.rank.name for battlesuit in battlesuits]),
+                ("Valkyrie", [battlesuit.character.name for battlesuit in battlesuits]),
+                ("Augment", [b.augment.name if b.augment else "" for b in battlesuits]),
+            ],
+        ),
+    )
+    for link, battlesuit in zip(links, battlesuits):
+        lines = [" ".join(str(core) for core in battlesuit.core_strengths)]
+        for rec in battlesuit.recommendations:
+            if rec.stage == "Advanced":
+                lines.extend(str(item) for item in (rec.weapon, rec.top, rec.mid, rec.bot))
+        embed.add_field(name=link.name, value="\n".join(filter(None, lines)) or "-", inline=True)
+    return embed
+
+
+def compare_embed(models: Sequence[WeaponModel] | Sequence[BattlesuitModel]) -> Embed:
+    """Render a side-by-side comparison of weapons or of battlesuits. Stats are laid out
+    in a table with a column per item, followed by a field per item with its skills or,
+    for battlesuits, its core strengths and advanced equipment.
+    """
+    if all(isinstance(model, WeaponModel) for model in models):
+        return _weapon_comparison(models)
+    elif all(isinstance(model, BattlesuitModel) for model in models):
+        return _battlesuit_comparison(models)
+    raise TypeError("Can only compare weapons with weapons, or battlesuits with battlesuits.")
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from itertools import groupby
+from typing import Any, Iterable, NamedTuple, Optional
+from models.wiki import (
+    BattlesuitModel,
+    ContentResponseModel,
+    normalize_title,
+    strip_suffix_from_title,
+    wiki_link,
+)
+from pydantic import ValidationError
+
+__all__ = ("Recommender", "RecommendationIndex", "battlesuit_recommenders", "recommended_by")
+
+STAGES = ("Beginner", "Economic", "Advanced", "Formation")
+
+
+class Recommender(NamedTuple):
+    """A battlesuit that recommends an item, along with where it does so."""
+
+    name: str  # name of the recommended item, as linked
+    battlesuit: str
+    stage: str  # one of `STAGES`
+    slot: str  # "T", "M" or "B" for stigmata; empty otherwise
+
+
+def recommendation_key(name: str) -> str:
+    """Key under which recommendations of an item are indexed, such that links to single
+    stigmata, e.g. `Thales (T)`, are found under their set.
+    """
+    return normalize_title(strip_suffix_from_title(name))
+
+
+def battlesuit_recommenders(page: dict[str, Any]) -> list[Recommender]:
+    """Validate the parsed content page of a battlesuit, and list every weapon, stigma and
+    battlesuit it links to in its recommendations and formations. Pages that don't
+    validate recommend nothing.
+    """
+    try:
+        model = BattlesuitModel(ContentResponseModel.from_parsed([page]))
+    except (ValidationError, KeyError, IndexError):
+        return []
+
+    battlesuit = (model.battlesuit or model.augment).name
+    recommenders = []
+    for rec in model.recommendations:
+        for slot, link in (("", rec.weapon), ("T", rec.top), ("M", rec.mid), ("B", rec.bot)):
+            recommenders.append(Recommender(link.name, battlesuit, rec.stage, slot))
+    for formation in model.formations:
+        recommenders.append(Recommender(formation.valk.name, battlesuit, "Formation", ""))
+    return [rec for rec in recommenders if rec.name.strip()]
+
+
+class RecommendationIndex:
+    """Reverse index of battlesuit recommendations, from the items they link to to the
+    battlesuits linking to them. Recommendations are kept per battlesuit page, such that
+    the index can be updated page by page; the reverse index is only rebuilt on the first
+    lookup after a change.
+    """
+
+    def __init__(self):
+        self._pages: dict[int, tuple[int, list[Recommender]]] = {}  # pageid to revid and links
+        self._index: Optional[dict[str, tuple[Recommender, ...]]] = None
+
+    def __len__(self) -> int:
+        return sum(len(recommenders) for _, recommenders in self._pages.values())
+
+    @property
+    def pageids(self) -> set[int]:
+        return set(self._pages)
+
+    def revision(self, pageid: int) -> Optional[int]:
+        """The revision of a page that its recommendations were taken from, if it is in
+        the index.
+        """
+        entry = self._pages.get(pageid)
+        return entry[0] if entry else None
+
+    def update(self, pages: dict[int, tuple[int, list[Recommender]]]) -> None:
+        """Add or replace the recommendations of battlesuit pages, as a dict of pageid to
+        revid and recommendations.
+        """
+        self._pages.update(pages)
+        self._index = None
+
+    def discard(self, pageids: Iterable[int]) -> None:
+        for pageid in pageids:
+            self._pages.pop(pageid, None)
+        self._index = None
+
+    def get(self, name: str) -> tuple[Recommender, ...]:
+        """Get the battlesuits that recommend an item, sorted by battlesuit and stage."""
+        if self._index is None:
+            self._build_index()
+        return self._index.get(recommendation_key(name), ())
+
+    def _build_index(self) -> None:
+        index: dict[str, list[Recommender]] = {}
+        for _, recommenders in self._pages.values():
+            for rec in recommenders:
+                index.setdefault(recommendation_key(rec.name), []).append(rec)
+
+        self._index = {
+            key: tuple(
+                sorted(
+                    set(recommenders),
+                    key=lambda rec: (rec.battlesuit, STAGES.index(rec.stage), "TMB".find(rec.slot)),
+                )
+            )
+            for key, recommenders in index.items()
+        }
+
+
+def recommended_by(recommenders: Iterable[Recommender], limit: int = 1024) -> Optional[dict]:
+    """Render the battlesuits recommending an item as an embed field dict, with a line
+    per battlesuit that lists its stages, and the slots for stigmata. Lines that don't fit
+    within `limit` characters are summarized. Returns `None` if there are none.
+    """
+    lines = []
+    for battlesuit, group in groupby(recommenders, key=lambda rec: rec.battlesuit):
+        stages = []
+        for stage, stage_group in groupby(group, key=lambda rec: rec.stage):
+            slots = "".join(rec.slot for rec in stage_group)
+            stages.append(f"{stage} ({slots})" if slots else stage)
+        lines.append(f"{wiki_link(battlesuit)}: {', '.join(stages)}")
+
+    if not lines:
+        return None
+
+    shown: list[str] = []
+    length = 0
+    for i, line in enumerate(lines):
+        if length + len(line) > limit - 20:  # Leave room for the summary
+            shown.append(f"...and {len(lines) - i} more")
+            break
+        shown.append(line)
+        length += len(line) + 1
+    return {"name": "Recommended by:", "value": "\n".join(shown), "inline": False}
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+from disnake.embeds import Embed
+
+import operator
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, NamedTuple, Optional
+import numpy as np
+from models.wiki import Emoji, IconMapping, StigmataModel, StigSlot, WeaponModel, wiki_link
+from pydantic import ValidationError
+
+__all__ = ("StatQuery", "StatRow", "StatTable", "stat_query_embed", "stat_rows")
+
+
+class StatRow(NamedTuple):
+    """The stats of one weapon, or of one piece of a stigmata set."""
+
+    name: str
+    kind: str  # "weapon" or "stigmata"
+    type: str  # weapon type; empty for stigmata
+    slot: str  # "T", "M" or "B"; empty for weapons
+    rarity: int
+    ATK: int
+    CRT: int
+    HP: int
+    DEF: int
+
+
+STAT_COLUMNS = ("rarity", "ATK", "CRT", "HP", "DEF")
+CATEGORICAL_COLUMNS = ("kind", "type", "slot")
+# Column names as they may be written in queries, to their actual names.
+COLUMN_NAMES = {column.lower(): column for column in (*STAT_COLUMNS, *CATEGORICAL_COLUMNS)}
+OPERATORS: dict[str, Callable[[Any, Any], Any]] = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    "!=": operator.ne,
+    "=": operator.eq,
+    ">": operator.gt,
+    "<": operator.lt,
+}
+# Bare words that are shorthand for a condition on a categorical column.
+SHORTHANDS: dict[str, tuple[str, str]] = {
+    **dict.fromkeys(("weapon", "weapons"), ("kind", "weapon")),
+    **dict.fromkeys(("stig", "stigs", "stigma", "stigmata"), ("kind", "stigmata")),
+    **{name: ("type", name) for name in IconMapping.__members__},
+    **{
+        IconMapping[name].value.split()[0].lower(): ("type", name)
+        for name in IconMapping.__members__
+    },
+    **{slot.name.lower(): ("slot", slot.value) for slot in StigSlot},
+    **{slot.value.lower(): ("slot", slot.value) for slot in StigSlot},
+}
+
+_OPERATOR_SPACING = re.compile(r"\s*([<>!]?=|[<>])\s*")
+_CONDITION = re.compile(rf"(\w+)({'|'.join(map(re.escape, OPERATORS))})(\w+)")
+_RARITY = re.compile(r"(\d+)(?:\*|★|-?stars?)")
+_SORT = re.compile(r"sort:(\w+)(?::(asc|desc))?")
+
+
+def stat_rows(kind: str, data: dict[str, str]) -> list[StatRow]:
+    """Validate the data of a weapon or stigmata page into rows of the stat table; one
+    for a weapon, and one for every piece of a stigmata set. Pages that don't validate
+    have no rows.
+    """
+    try:
+        if kind == "weapon":
+            weapon = WeaponModel(**data)
+            return [
+                StatRow(
+                    weapon.name.name,
+                    kind,
+                    weapon.type,
+                    "",
+                    weapon.rarity,
+                    weapon.ATK,
+                    weapon.CRT,
+                    0,
+                    0,
+                )
+            ]
+
+        rows = []
+        for slot in StigSlot:
+            if f"{slot.value}effect" in data:
+                stig = StigmataModel(slot=slot.value, **data)
+                rows.append(
+                    StatRow(
+                        stig.set.name,
+                        kind,
+                        "",
+                        slot.value,
+                        stig.rarity,
+                        stig.ATK,
+                        stig.CRT,
+                        stig.HP,
+                        stig.DEF,
+                    )
+                )
+        return rows
+
+    except (ValidationError, KeyError):
+        return []
+
+
+@dataclass
+class StatQuery:
+    """A filter on the stat table, along with the column to sort by.
+
+    Queries are written as terms separated by spaces, all of which have to hold:
+    - conditions such as `atk>=500`, `crt>20` or `type=lance`;
+    - shorthands such as `5*`/`5-star` for rarity, `lances` for the weapon type,
+      `stigmata` for the kind of item and `top`/`T` for the stigmata slot;
+    - `sort:atk` to sort by a column, from high to low, or `sort:atk:asc` for low to high.
+    """
+
+    conditions: list[tuple[str, Callable[[Any, Any], Any], Any]] = field(default_factory=list)
+    sort: Optional[str] = None
+    descending: bool = True
+
+    @classmethod
+    def parse(cls, text: str) -> StatQuery:
+        """Parse a query. Raises a :class:`ValueError` if any of its terms isn't
+        understood, or if it has no terms at all.
+        """
+        query = cls()
+        terms = _OPERATOR_SPACING.sub(r"\1", text.lower()).replace(",", " ").split()
+        if not terms:
+            raise ValueError("Empty query.")
+
+        for term in terms:
+            if term in SHORTHANDS:
+                column, value = SHORTHANDS[term]
+                query.conditions.append((column, operator.eq, value))
+            elif match := _RARITY.fullmatch(term):
+                query.conditions.append(("rarity", operator.eq, int(match[1])))
+            elif match := _SORT.fullmatch(term):
+                if match[1] not in COLUMN_NAMES or COLUMN_NAMES[match[1]] not in STAT_COLUMNS:
+                    raise ValueError(f"Cannot sort by '{match[1]}'.")
+                query.sort = COLUMN_NAMES[match[1]]
+                query.descending = match[2] != "asc"
+            elif match := _CONDITION.fullmatch(term):
+                query.conditions.append(cls._parse_condition(*match.groups()))
+            else:
+                raise ValueError(f"Unknown term '{term}'.")
+
+        return query
+
+    @staticmethod
+    def _parse_condition(name: str, op: str, value: str) -> tuple[str, Callable, Any]:
+        column = COLUMN_NAMES.get(name)
+        if column is None:
+            raise ValueError(f"Unknown column '{name}'.")
+        if column in STAT_COLUMNS:
+            if not value.isdigit():
+                raise ValueError(f"'{value}' is not a number.")
+            return column, OPERATORS[op], int(value)
+
+        if op not in ("=", "!="):
+            raise ValueError(f"Column '{name}' can only be compared with = or !=.")
+        if column == "kind":  # Allow e.g. kind=weapons
+            value = SHORTHANDS.get(value, (column, value))[1]
+        elif value in SHORTHANDS and SHORTHANDS[value][0] == column:
+            value = SHORTHANDS[value][1]
+        return column, OPERATORS[op], value.upper() if column == "slot" else value
+
+
+class StatTable:
+    """Columnar table of the stats of all weapons and stigmata, which can be filtered and
+    sorted through :class:`StatQuery`. Rows are kept per page, such that the table can be
+    updated page by page; the columns are only rebuilt on the first query after a change.
+    """
+
+    def __init__(self):
+        self._pages: dict[int, tuple[int, list[StatRow]]] = {}  # pageid to revid and rows
+        self._columns: Optional[dict[str, np.ndarray]] = None
+        self._categories: dict[str, list[str]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(rows) for _, rows in self._pages.values())
+
+    @property
+    def pageids(self) -> set[int]:
+        return set(self._pages)
+
+    def revision(self, pageid: int) -> Optional[int]:
+        """The revision of a page that its rows were made from, if it is in the table."""
+        entry = self._pages.get(pageid)
+        return entry[0] if entry else None
+
+    def update(self, pages: dict[int, tuple[int, list[StatRow]]]) -> None:
+        """Add or replace the rows of pages, as a dict of pageid to revid and rows."""
+        self._pages.update(pages)
+        self._columns = None
+
+    def discard(self, pageids: Iterable[int]) -> None:
+        for pageid in pageids:
+            self._pages.pop(pageid, None)
+        self._columns = None
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        """The table as arrays by column name. Categorical columns hold indices into
+        their categories, and the `name_rank` column holds the alphabetical rank of every
+        name, for sorting.
+        """
+        if self._columns is None:
+            self._build_columns()
+        return self._columns
+
+    def _build_columns(self) -> None:
+        rows = [row for _, page_rows in self._pages.values() for row in page_rows]
+        n = len(rows)
+        columns: dict[str, np.ndarray] = {
+            "name": np.array([row.name for row in rows], dtype=object),
+        }
+        for column in STAT_COLUMNS:
+            index = StatRow._fields.index(column)
+            columns[column] = np.fromiter((row[index] for row in rows), dtype=np.int32, count=n)
+        for column in CATEGORICAL_COLUMNS:
+            index = StatRow._fields.index(column)
+            categories, codes = np.unique([row[index] for row in rows], return_inverse=True)
+            self._categories[column] = categories.tolist()
+            columns[column] = codes.astype(np.int16).reshape(n)
+
+        name_rank = np.empty(n, dtype=np.int32)
+        name_rank[np.argsort(columns["name"], kind="stable")] = np.arange(n, dtype=np.int32)
+        columns["name_rank"] = name_rank
+        self._columns = columns
+
+    def query(self, query: StatQuery, limit: int = 15) -> tuple[int, list[StatRow]]:
+        """Find the rows matching a query, sorted by its sort column, or by rarity and
+        name if it has none. Returns the total number of matches, and the first `limit`.
+        """
+        columns = self.columns
+        mask = np.ones(len(columns["name"]), dtype=bool)
+        for column, op, value in query.conditions:
+            if column in CATEGORICAL_COLUMNS:
+                categories = self._categories[column]
+                value = categories.index(value) if value in categories else -1
+            mask &= op(columns[column], value)
+
+        matches = np.flatnonzero(mask)
+        sign = -1 if query.descending else 1
+        keys = [columns["name_rank"][matches], -columns["rarity"][matches]]
+        if query.sort is not None:
+            keys.append(sign * columns[query.sort][matches])
+        order = matches[np.lexsort(keys)][:limit]
+
+        rows = [
+            StatRow(
+                columns["name"][i],
+                *(self._categories[c][columns[c][i]] for c in CATEGORICAL_COLUMNS),
+                *(int(columns[c][i]) for c in STAT_COLUMNS),
+            )
+            for i in order
+        ]
+        return len(matches), rows
+
+
+def stat_query_embed(text: str, total: int, rows: list[StatRow]) -> Embed:
+    """Render the results of a stat table query."""
+    lines = []
+    for row in rows:
+        name = f"{wiki_link(row.name)} ({row.slot})" if row.slot else wiki_link(row.name)
+        stats = " · ".join(
+            f"{column} {getattr(row, column)}"
+            for column in STAT_COLUMNS[1:]
+            if getattr(row, column)
+        )
+        lines.append(f"{row.rarity}{Emoji.STAR.value} {name}: {stats or 'no stats'}")
+
+    shown = f", showing the first {len(rows)}" if len(rows) < total else ""
+    return Embed(
+        title=f"{total} results for `{text}`{shown}",
+        description="\n".join(lines) or "Nothing matches this query.",
+    )
@@ -3,24 +3,25 @@ from __future__ import annotations
 from disnake.embeds import Embed
 from disnake.utils import escape_markdown
 
+import heapq
+import itertools
+import sys
 import urllib
 from collections import defaultdict
+from dataclasses import dataclass
 from enum import Enum, EnumMeta
-from functools import reduce
-from operator import itemgetter
-from typing import Any, Callable, Optional
+from functools import lru_cache, reduce
+from operator import itemgetter, or_
+from typing import Any, Callable, Iterable, Iterator, Optional
 import regex
-import wikitextparser as wtp
-from pydantic import BaseModel, Field, PrivateAttr, ValidationError, root_validator, validator
+from pydantic import BaseModel, Field, PrivateAttr, root_validator, validator
+from utils.classes import NgramIndex, SubstringIndex
 from utils.helpers import all_equal
-
-try:
-    from cfuzzyset import cFuzzySet as FuzzySet
-except ImportError:
-    from fuzzyset import FuzzySet
+from utils.wikitext import extract_template_arguments
 
 BASE_WIKI_URL = "https://honkaiimpact3.fandom.com/"
 BASE_IMG_URL = "https://static.wikia.nocookie.net/honkaiimpact3_gamepedia_en/images/"
+IMAGE_REDIRECT_URL = f"{BASE_WIKI_URL}/Special:Redirect/file/"
 
 
 class EmojiMeta(EnumMeta):  # TODO: Move
@@ -36,6 +37,7 @@ class EmojiMeta(EnumMeta):  # TODO: Move
     def __init__(self, name, bases, namespace) -> None:
         super().__init__(name, bases, namespace)
         self.__sortkeys__ = sorted((e.name.replace("_", " ") for e in self), key=len, reverse=True)
+        self.__sortkeys_pattern__ = regex.compile("|".join(self.__sortkeys__), regex.I)
 
 
 class Emoji(Enum, metaclass=EmojiMeta):  # TODO: Move
@@ -135,135 +137,355 @@ class ValidCategory(Enum):
 # API response handlers
 
 
+_TITLE_SUFFIX = regex.compile(r"(.+?)(?=$| ?[\(/].*)")
+
+
 def strip_suffix_from_title(title: str) -> str:
-    return regex.match(r"(.+?)(?=$| ?[\(/].*)", title)[0]
+    return _TITLE_SUFFIX.match(title)[0]
 
 
-class QueryPage(BaseModel):
+_index_versions = itertools.count()
 
-    title: str
-    pageid_: set[str] = Field(alias="pageid")
-    categories: set[ValidCategory] = Field(alias="categories")
-    aliases: set[str] = Field(alias="redirects", default_factory=set)
 
-    _fuzzy: FuzzySet = PrivateAttr(None)
+def normalize_title(title: str) -> str:
+    """Normalize a title, alias or user query for case-insensitive comparisons."""
+    return title.strip().lower()
 
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self._fuzzy = FuzzySet([self.title, *self.aliases])
-
-    @validator("title", pre=True, allow_reuse=True)
-    def strip_suffixes(cls, title: str):
-        return strip_suffix_from_title(title)
-
-    @validator("pageid_", pre=True, allow_reuse=True)
-    def ensure_pageid_set(cls, pageid_: Any):
-        if isinstance(pageid_, set):
-            return pageid_
-        elif isinstance(pageid_, (str, int)):
-            return {pageid_}
+
+# Bit of every valid category in a category bitmask, in order of definition.
+CATEGORY_BITS = {category: 1 << i for i, category in enumerate(ValidCategory)}
+
+
+def category_mask(categories: Iterable[ValidCategory]) -> int:
+    """Combine categories into a bitmask, such that pages can be classified by a single
+    bitwise and with the mask of a group of categories.
+    """
+    return reduce(or_, (CATEGORY_BITS[category] for category in categories), 0)
+
+
+class QueryPage:
+    """Entry of the wiki index. Pages of the same item under different titles, such as
+    the pieces of a stigmata set, are merged into one entry under the title without
+    suffixes, with the pageids of all of them.
+
+    As the index holds an entry for every page of interest on the wiki, entries are
+    kept small: categories are stored as a bitmask over :class:`ValidCategory`, and the
+    pageids are joined once into an interned string.
+
+    Parameters:
+    -----------
+    title: :class:`str`
+        The title of the page, without suffixes.
+    pageids: Iterable[:class:`int` | :class:`str`]
+        The pageids of all pages with this title.
+    categories: :class:`int` | Iterable[:class:`ValidCategory`]
+        The categories of the page, or their bitmask.
+    aliases: Iterable[:class:`str`]
+        The titles of the redirects to the page.
+    """
+
+    __slots__ = ("title", "pageids", "pageid", "category_mask", "aliases")
+
+    def __init__(
+        self,
+        title: str,
+        pageids: Iterable[int | str],
+        categories: int | Iterable[ValidCategory],
+        aliases: Iterable[str] = (),
+    ):
+        self.title = title
+        self._set_pageids(pageids)
+        if isinstance(categories, int):
+            self.category_mask = categories
         else:
-            return set(pageid_)
+            self.category_mask = category_mask(categories)
+        self.aliases: tuple[str, ...] = tuple(dict.fromkeys(aliases))
 
-    @validator("categories", pre=True, allow_reuse=True)
-    def extract_category(cls, categories: dict[str, str]):
-        return {category["title"] for category in categories}
+    def _set_pageids(self, pageids: Iterable[int | str]) -> None:
+        self.pageids: tuple[str, ...] = tuple(sorted({str(pageid) for pageid in pageids}))
+        self.pageid: str = sys.intern("|".join(self.pageids))
 
-    @validator("aliases", pre=True, allow_reuse=True)
-    def extract_redirect(cls, redirects: dict[str], values):
-        title = values["title"]
-        return [redirect["title"] for redirect in redirects if redirect["title"] not in title]
+    @classmethod
+    def from_api(cls, page: dict[str, Any]) -> QueryPage:
+        """Create an entry from a page in an API response or a snapshot. Raises a
+        :class:`ValueError` if the page doesn't list its (valid) categories.
+        """
+        title = strip_suffix_from_title(page["title"])
+        if "categories" not in page:
+            raise ValueError(f"Page '{title}' has no categories.")
+        categories = [ValidCategory(category["title"]) for category in page["categories"]]
+
+        pageids = page["pageid"]
+        if isinstance(pageids, (str, int)):
+            pageids = [pageids]
+
+        aliases = [
+            redirect["title"]
+            for redirect in page.get("redirects", ())
+            if redirect["title"] not in title
+        ]
+        return cls(title, pageids, categories, aliases)
+
+    @classmethod
+    def validate(cls, v):
+        if isinstance(v, cls):
+            return v
+        if not isinstance(v, dict):
+            raise TypeError("QueryPage or dict required")
+        return cls.from_api(v)
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    def __repr__(self):
+        return f"QueryPage({self.title!r}, pageid={self.pageid!r})"
 
     @property
-    def pageid(self) -> str:
-        return "|".join(self.pageid_)
+    def categories(self) -> list[ValidCategory]:
+        return [category for category, bit in CATEGORY_BITS.items() if self.category_mask & bit]
 
     def update(self, other: QueryPage) -> None:
         if self.title != other.title:
             raise KeyError("Cannot merge two pages with different titles.")
-        self.pageid_.update(other.pageid_)
-        self.categories.update(other.categories)
-        self.aliases.update(other.aliases)
-        for alias in other.aliases:
-            self._fuzzy.add(alias)
+        self._set_pageids((*self.pageids, *other.pageids))
+        self.category_mask |= other.category_mask
+        self.aliases = tuple(dict.fromkeys((*self.aliases, *other.aliases)))
 
 
 class QueryResponse(BaseModel):
 
     pages: dict[str, QueryPage] = Field(alias="query")
 
+    _lookup: dict[str, QueryPage] = PrivateAttr(default_factory=dict)
+    _ngrams: NgramIndex[tuple[str, str]] = PrivateAttr(default_factory=NgramIndex)
+    _substrings: SubstringIndex[tuple[str, str]] = PrivateAttr(default_factory=SubstringIndex)
+    _version: int = PrivateAttr(default_factory=lambda: next(_index_versions))
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        for page in self.pages.values():
+            self._index_page(page)
+
     @validator("pages", pre=True, allow_reuse=True)
     def unpack_query(cls, query: dict[str, dict[str, dict]]):
         pages: dict[str, QueryPage] = {}
         for page in query["pages"].values():
             try:
-                qp = QueryPage(**page)
-                if pages.setdefault(qp.title, qp) is not qp:
-                    pages[qp.title].update(qp)
-            except ValidationError:
-                pass
+                qp = QueryPage.from_api(page)
+            except (KeyError, ValueError):
+                continue
+            if pages.setdefault(qp.title, qp) is not qp:
+                pages[qp.title].update(qp)
 
         return pages
 
     def __len__(self) -> int:
         return len(self.pages)
 
+    @property
+    def version(self) -> int:
+        """A number that changes whenever the index is modified. This is unique across
+        all instances, so it can also be used to tell whether an index was replaced.
+        """
+        return self._version
+
+    def _index_page(self, page: QueryPage) -> None:
+        """Add a page's title and aliases to the lookup table. Titles take precedence
+        over aliases of other pages.
+        """
+        for alias in page.aliases:
+            self._lookup.setdefault(normalize_title(alias), page)
+        self._lookup[normalize_title(page.title)] = page
+
+        for name in (page.title, *page.aliases):
+            self._ngrams.add(normalize_title(name), (page.title, name))
+            self._substrings.add(normalize_title(name), (page.title, name))
+
     def get(self, k: str) -> QueryPage | None:
-        k = k.lower()
-        for page_name, page in self.pages.items():
-            if k == page_name.lower() or any(k == alias.lower() for alias in page.aliases):
-                return page
+        return self._lookup.get(normalize_title(k))
 
     def update(self, other: QueryResponse | QueryPage) -> None:
         if isinstance(other, QueryPage):
-            page = self.pages[other.title]
-            if not page:
-                self.pages[other.title] = other
+            other_pages = [other]
+        elif isinstance(other, QueryResponse):
+            other_pages = other.pages.values()
+        else:
+            raise TypeError("other must be of type QueryResponse or QueryPage.")
+
+        for other_page in other_pages:
+            page = self.pages.get(other_page.title)
+            if page is None:
+                page = self.pages[other_page.title] = other_page
             else:
-                page.update(other)
+                page.update(other_page)
+            self._index_page(page)
+
+        self._version = next(_index_versions)
+
+    def discard(self, page: QueryPage) -> None:
+        """Remove a page and its lookup entries from the index, if present."""
+        page = self.pages.pop(page.title, None)
+        if page is None:
+            return
+
+        removed = set()
+        for name in (page.title, *page.aliases):
+            key = normalize_title(name)
+            if self._lookup.get(key) is page:
+                del self._lookup[key]
+                removed.add(key)
+            self._ngrams.remove(key, (page.title, name))
+            self._substrings.remove(key, (page.title, name))
+
+        # Other pages may have a title or alias that was shadowed by the removed page.
+        if removed:
+            for other in self.pages.values():
+                for alias in other.aliases:
+                    if (key := normalize_title(alias)) in removed:
+                        self._lookup.setdefault(key, other)
+            for other in self.pages.values():
+                if (key := normalize_title(other.title)) in removed:
+                    self._lookup[key] = other
+
+        self._version = next(_index_versions)
+
+    def dump(self) -> dict[str, dict]:
+        """Dump the index to a dict in the same shape as the API response it was
+        created from, such that `QueryResponse(**response.dump())` restores it.
+        """
+        return {
+            "query": {
+                "pages": {
+                    title: {
+                        "title": title,
+                        "pageid": list(page.pageids),
+                        "categories": [{"title": category.value} for category in page.categories],
+                        "redirects": [{"title": alias} for alias in sorted(page.aliases)],
+                    }
+                    for title, page in self.pages.items()
+                }
+            }
+        }
 
-        elif isinstance(other, QueryResponse):
-            for other_name, other_page in other.pages.items():
-                page = self.pages.get(other_name)
-                if page is None:
-                    self.pages[other_name] = other_page
-                else:
-                    page.update(other_page)
+    def search(self, query: str, n: int = 20, *, min_matches: int = 5) -> dict[str, str]:
+        """Find the `n` pages that best match the query, as a dict of match descriptor
+        to page title. Pages with a title or alias containing the query are found first;
+        fuzzy matching is only used in case this yields fewer than `min_matches` pages.
+        """
+        matches = self.substring(query, n)
+        if len(matches) >= min(n, min_matches):
+            return matches
+
+        titles = set(matches.values())
+        for descriptor, title in self.fuzzy(query, n).items():
+            if len(matches) >= n:
+                break
+            if title not in titles:
+                matches[descriptor] = title
+
+        return matches
+
+    def substring(
+        self, query: str, n: int = 20, *, among: Optional[Iterable[str]] = None
+    ) -> dict[str, str]:
+        """Find the `n` pages with a title or alias containing the query, as a dict of
+        match descriptor to page title. Prefix matches are preferred over other matches.
+        If `among` is passed, only the pages with those titles are considered.
+        """
+        query = normalize_title(query)
+        if not query:  # Everything matches; just show the shortest titles
+            titles = self.pages if among is None else among
+            return {title: title for title in heapq.nsmallest(n, titles, key=len)}
+
+        if among is None:
+            matches = self._substrings.search(query)
+        else:
+            matches = self._match_pages(query, among)
 
-    def fuzzy(self, query: str, n: int = 20):
-        matches = []
-        for name, page in self.pages.items():
+        best: dict[str, tuple[int, bool, int, str]] = {}
+        for (position, length), (title, name) in matches:
+            match = (position, name != title, length, name)  # prefer titles over aliases
+            if title not in best or match < best[title]:
+                best[title] = match
 
-            match = page._fuzzy.get(query)
-            if match:
-                best_score, best_name = max(match)
-                val = name if best_name == name else f"{name} ({best_name})"
+        return {
+            f"{title} ({name})" if is_alias else title: title
+            for title, (_, is_alias, _, name) in heapq.nsmallest(
+                n, best.items(), key=lambda item: item[1]
+            )
+        }
 
-                alias_pair = (best_score, name, val)
-                matches.append(alias_pair)
+    def _match_pages(
+        self, query: str, titles: Iterable[str]
+    ) -> Iterator[tuple[tuple[int, int], tuple[str, str]]]:
+        """Directly match the query against the names of a few pages, yielding the same
+        as the substring index would for those pages.
+        """
+        for title in titles:
+            page = self.pages.get(title)
+            if page is None:
+                continue
+
+            for name in (page.title, *page.aliases):
+                key = normalize_title(name)
+                offset = key.find(query)
+                while offset != -1:
+                    yield SubstringIndex.rank(key, offset), (page.title, name)
+                    offset = key.find(query, offset + 1)
+
+    def fuzzy(self, query: str, n: int = 20) -> dict[str, str]:
+        """Fuzzily match the query against all titles and aliases, and return the `n`
+        best matching pages as a dict of match descriptor to page title.
+        """
+        best: dict[str, tuple[float, bool, str]] = {}
+        for score, (title, name) in self._ngrams.search(normalize_title(query)):
+            match = (score, name == title, name)  # prefer titles over aliases on ties
+            if match > best.get(title, (0.0,)):
+                best[title] = match
 
         return {
-            match_descriptor: page_name
-            for _, page_name, match_descriptor in sorted(matches)[:-n:-1]
+            title if is_title else f"{title} ({name})": title
+            for title, (_, is_title, name) in heapq.nlargest(
+                n, best.items(), key=lambda item: item[1]
+            )
         }
 
 
-class WikiText(wtp._wikitext.WikiText):
-    """Custom extension to wikitextparser's WikiText class such that it
-    supports pydantic model validation.
+class RecentChange(BaseModel):
+    """A single entry of the wiki's recent changes feed. Log entries (deletions, moves)
+    additionally carry their `logtype` and `logparams`.
     """
 
-    @classmethod
-    def __get_validators__(cls):
-        yield cls._validate
+    type: str
+    title: str
+    pageid: int = 0
+    timestamp: str
+    logtype: Optional[str]
+    logparams: dict[str, Any] = Field(default_factory=dict)
 
-    @classmethod
-    def _validate(cls, value):
-        if isinstance(value, wtp._wikitext.WikiText):
-            return value
-        elif isinstance(value, str):
-            return wtp.parse(value)
-        raise TypeError("WikiText input must be either str or WikiText.")
+
+class RecentChangesResponse(BaseModel):
+
+    changes: list[RecentChange] = Field(alias="query")
+
+    @validator("changes", pre=True, allow_reuse=True)
+    def unpack_changes(cls, query: dict[str, list[dict]]):
+        return query["recentchanges"]
+
+    def update(self, other: RecentChangesResponse) -> None:
+        self.changes.extend(other.changes)
+
+    @property
+    def titles(self) -> set[str]:
+        """All titles touched by the changes, including the targets of page moves."""
+        titles = {change.title for change in self.changes}
+        titles.update(
+            change.logparams["target_title"]
+            for change in self.changes
+            if change.logtype == "move" and "target_title" in change.logparams
+        )
+        return titles
 
 
 class Wikilink:
@@ -306,29 +528,26 @@ class Wikilink:
 class ContentPage(BaseModel):
     """Class that represents the content of any page on the wiki.
 
-    Page data is requested as wikitext through the api, parsed using
-    wikitextparser, and then disassembled into a dict `data`.
+    Page data is requested as wikitext through the api, and the arguments of its
+    top-level templates are then extracted into a dict `data`.
     """
 
     pageid: int
     title: str
-    wikitext: WikiText
+    revid: Optional[int]
+    wikitext: str
     data: Optional[dict[str, str]]
 
     @root_validator(pre=True, allow_reuse=True)
     def extract_wikitext(cls, values):
-        values["wikitext"] = values["revisions"][0]["slots"]["main"]["*"]
+        revision = values["revisions"][0]
+        values["revid"] = revision.get("revid")
+        values["wikitext"] = revision["slots"]["main"]["*"]
         return values
 
     @validator("data", always=True, allow_reuse=True)
     def wikitext_to_dict(cls, _, values):
-        wikitext: WikiText = values["wikitext"]
-        return {
-            argument.name.strip(): argument.value.strip()
-            for template in wikitext.templates
-            for argument in template.arguments
-            if not template.ancestors()  # Avoid nested arguments
-        }
+        return extract_template_arguments(values["wikitext"])
 
 
 class ContentResponseModel(BaseModel):
@@ -338,27 +557,97 @@ class ContentResponseModel(BaseModel):
     instances can be losslessly combined. This is mainly used in
     situations where the request is too large and the wiki responds
     with `continue` parameters.
+
+    Pages are indexed by their normalized title without suffixes, such that the pages of
+    one item can be looked up directly. Lookups through :meth:`get` and :meth:`get_all`
+    build an index on the attribute or data key they look up by on first use.
     """
 
     pages: list[ContentPage]
 
+    _by_name: dict[str, list[ContentPage]] = PrivateAttr(default_factory=dict)
+    _indexes: dict[str, dict[Any, list[ContentPage]]] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._index_pages(self.pages)
+
     @root_validator(pre=True, allow_reuse=True)
     def unpack_pages(cls, values: dict[str, dict[str]]):
-        return {"pages": [ContentPage(**page) for page in values["query"]["pages"].values()]}
+        if "query" not in values:  # Already unpacked, e.g. when combining cached pages
+            return values
+        return {
+            "pages": [
+                ContentPage(**page)
+                for page in values["query"]["pages"].values()
+                if "revisions" in page  # Skip missing pages
+            ]
+        }
+
+    @classmethod
+    def from_parsed(cls, pages: list[dict[str, Any]]) -> ContentResponseModel:
+        """Create a response from pages that were already parsed and exported through
+        :meth:`ContentPage.dict`, without validating them all over again.
+        """
+        response = cls.construct(pages=[ContentPage.construct(**page) for page in pages])
+        response._index_pages(response.pages)
+        return response
+
+    @staticmethod
+    def _rarity(page: ContentPage) -> int:
+        try:
+            return int(page.data.get("rarity", 0))
+        except ValueError:
+            return 0
+
+    def _index_pages(self, pages: list[ContentPage]) -> None:
+        """Add pages to the name index, keeping the pages of every name sorted from high to
+        low rarity, and to any lookup indexes that were already built.
+        """
+        names = set()
+        for page in pages:
+            if page.title:
+                name = normalize_title(strip_suffix_from_title(page.title))
+                self._by_name.setdefault(name, []).append(page)
+                names.add(name)
+            for key, index in self._indexes.items():
+                self._index_by(index, key, page)
+
+        # Stable, such that the first page of the highest rarity stays in front.
+        for name in names:
+            self._by_name[name].sort(key=self._rarity, reverse=True)
+
+    @staticmethod
+    def _index_by(index: dict[Any, list[ContentPage]], key: str, page: ContentPage) -> None:
+        try:
+            index.setdefault(getattr(page, key, page.data.get(key)), []).append(page)
+        except TypeError:  # Unhashable value
+            pass
+
+    def _lookup(self, key: str, value: Any) -> list[ContentPage]:
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = {}
+            for page in self.pages:
+                self._index_by(index, key, page)
+        return index.get(value, [])
 
     def update(self, other: ContentResponseModel) -> None:
-        self.pages.append(other.pages)
+        self.pages.extend(other.pages)
+        self._index_pages(other.pages)
 
     def get(self, **kwargs: str) -> ContentPage:
-        for page in self.pages:
-            if all(getattr(page, k, page.data.get(k)) == v for k, v in kwargs.items()):
-                return page
+        return next(iter(self.get_all(**kwargs)), None)
 
     def get_all(self, **kwargs: str) -> list[ContentPage]:
+        if not kwargs:
+            return list(self.pages)
+
+        (key, value), *others = kwargs.items()
         return [
             page
-            for page in self.pages
-            if all(getattr(page, k, page.data.get(k)) == v for k, v in kwargs.items())
+            for page in self._lookup(key, value)
+            if all(getattr(page, k, page.data.get(k)) == v for k, v in others)
         ]
 
     def find(self, predicate: Callable[[ContentPage], bool]) -> ContentPage:
@@ -370,18 +659,56 @@ class ContentResponseModel(BaseModel):
         return [page for page in self.pages if predicate(page)]
 
     def highest_rarity_by_name(self, name: str) -> ContentPage:
-        def predicate(page: ContentPage) -> int:
-            title = page.title
-            if not title:
-                return 0
-            name_match = strip_suffix_from_title(title).lower() == name.lower()
-            rarity = page.data.get("rarity", 0)
-            return int(name_match and rarity)
-
-        page = max(self.pages, key=predicate)
-        if not predicate(page):
+        pages = self._by_name.get(normalize_title(name))
+        if not pages or not self._rarity(pages[0]):
             raise KeyError(f"No page with name '{name}'.")
-        return page
+        return pages[0]
+
+
+class RevisionsResponse(BaseModel):
+    """Class that represents the response of an API call for only the latest revision
+    ids of pages, used to check whether any content has changed. Missing (deleted)
+    pages are not included.
+    """
+
+    revids: dict[int, int] = Field(alias="query")
+
+    @validator("revids", pre=True, allow_reuse=True)
+    def unpack_revids(cls, query: dict[str, dict[str, dict]]):
+        return {
+            page["pageid"]: page["revisions"][0]["revid"]
+            for page in query["pages"].values()
+            if "revisions" in page
+        }
+
+    def update(self, other: RevisionsResponse) -> None:
+        self.revids.update(other.revids)
+
+
+class ImageInfoResponse(BaseModel):
+    """Class that represents the response of an API call for the urls of files. Urls
+    are stored by file title, under the titles as they were requested as well as
+    under their normalized and redirect target titles. Missing files are not included.
+    """
+
+    urls: dict[str, str] = Field(alias="query")
+
+    @validator("urls", pre=True, allow_reuse=True)
+    def unpack_urls(cls, query: dict[str, Any]):
+        urls = {
+            page["title"]: page["imageinfo"][0]["url"]
+            for page in query["pages"].values()
+            if page.get("imageinfo")
+        }
+        # Titles are normalized first and then follow redirects, so resolve in reverse.
+        for key in ("redirects", "normalized"):
+            for alias in query.get(key, ()):
+                if alias["to"] in urls:
+                    urls[alias["from"]] = urls[alias["to"]]
+        return urls
+
+    def update(self, other: ImageInfoResponse) -> None:
+        self.urls.update(other.urls)
 
 
 # Generic
@@ -394,29 +721,45 @@ def urlify(s: str):
     return urllib.parse.quote(s.replace(" ", "_"))
 
 
+@lru_cache(maxsize=4096)
 def image_link(name: str):
     """Tries to get an image url by name from the HI3 wiki."""
-    return f"{BASE_WIKI_URL}/Special:Redirect/file/{urlify(name)}.png"
+    return f"{IMAGE_REDIRECT_URL}{urlify(name)}.png"
+
+
+def image_file(link: str) -> Optional[str]:
+    """Get the name of the file an :func:`image_link` points to, or `None` if the link
+    isn't one.
+    """
+    if not link.startswith(IMAGE_REDIRECT_URL):
+        return None
+    return urllib.parse.unquote(link.removeprefix(IMAGE_REDIRECT_URL))
 
 
 def wiki_link(name: str):
     return f"[{name}]({BASE_WIKI_URL}{urlify(name)})"
 
 
+_WIKILINK = regex.compile(r"(\[\[(.*?)\]\])")
+
+
 def resolve_wikilinks(field: str):
-    return regex.sub(r"(\[\[(.*?)\]\])", lambda m: wiki_link(m[2]), field)
+    return _WIKILINK.sub(lambda m: wiki_link(m[2]), field)
+
+
+TAG_FORMATS = {
+    "'''": "**{0}**",
+    "\\'\\'\\'": "**{0}**",
+    "br": "\n",
+    "increase": "**{0}**",
+    "color-blue": "**{0}**",
+    "color-orange": "**{0}**\n",
+}
 
 
 def convert_tag(match) -> str:
     result = match.groupdict()
-    todo = {
-        "'''": "**{0}**",
-        "\\'\\'\\'": "**{0}**",
-        "br": "\n",
-        "increase": "**{0}**",
-        "color-blue": "**{0}**",
-        "color-orange": "**{0}**\n",
-    }[result["t"]]
+    todo = TAG_FORMATS[result["t"]]
 
     m = result["m"]
     if m:
@@ -424,16 +767,130 @@ def convert_tag(match) -> str:
     return todo.format(m)
 
 
+_TAGS = regex.compile(
+    r"(?P<t>\\?'\\?'\\?')(?P<m>.*?)\\?'\\?'\\?'"  # '''|x|''' -> **|x|**
+    r"|<(?P<t>br).*?>(?P<m>\n? ?)"  # <br> or <br>\n -> \n
+    r"|<span class=\"(?P<t>[\w-]+)\">\s?(?P<m>.*?)\s?</span>",  # <span class=|x|>|y|</span>
+    regex.S,
+)
+
+
 def eliminate_tags(field: str):
-    return regex.sub(
-        r"(?P<t>\\?'\\?'\\?')(?P<m>.*?)\\?'\\?'\\?'"  # '''|x|''' -> **|x|**
-        r"|<(?P<t>br).*?>(?P<m>\n? ?)"  # <br> or <br>\n -> \n
-        r"|<span class=\"(?P<t>[\w-]+)\">\s?(?P<m>.*?)\s?</span>",  # <span class=|x|>|y|</span>
-        convert_tag,
-        field,
-        0,
-        regex.S,
-    )
+    return _TAGS.sub(convert_tag, field)
+
+
+# Matches everything that escape_markdown, resolve_wikilinks and eliminate_tags act upon,
+# such that all three can be applied in one go by fix_markup.
+_MARKUP = regex.compile(
+    r"(?P<link>\[\[(?P<link_text>.*?)\]\])"
+    r"|(?P<escape>[_~|*`])"
+    r"|(?P<quote>^>)"
+    r"|(?P<bold>(?s:'''(?P<bold_text>.*?)'''))"
+    r"|(?P<br>(?s:<br.*?>\n? ?))"
+    r'|(?P<span>(?s:<span class="(?P<t>(?:[^\W_]|-)+)">\s?(?P<span_text>.*?)\s?</span>))',
+    regex.M,
+)
+# Backslashes, urls, markdown links, and tags or apostrophes inside of wikilinks interact with
+# the separate passes in ways that a single pass cannot reproduce.
+_UNSAFE_MARKUP = regex.compile(r"\\|:/|\]\(|\[\[(?:(?!\]\]).)*?['<>]")
+
+
+def fix_markup(s: str) -> str:
+    """Escape markdown, resolve wikilinks and convert tags in a single pass, with the exact
+    same result as applying :func:`escape_markdown`, :func:`resolve_wikilinks` and
+    :func:`eliminate_tags` one after the other. Falls back to doing just that for strings
+    in which the passes interact.
+    """
+    if _UNSAFE_MARKUP.search(s):
+        return eliminate_tags(resolve_wikilinks(escape_markdown(s)))
+    return _fix_markup(s, 0, len(s))
+
+
+def _fix_markup(s: str, start: int, end: int) -> str:
+    parts = []
+    position = start
+    for match in _MARKUP.finditer(s, start, end):
+        match_start, match_end = match.span()
+        parts.append(s[position:match_start])
+        if match["link"] is not None:
+            parts.append(wiki_link(_fix_markup(s, *match.span("link_text"))))
+        elif match["escape"] is not None:
+            parts.append("\\" + match[0])
+        elif match["quote"] is not None:
+            # Quotes are looked at in full, even when they run past the end of a tag.
+            quote_start, quote_end = match_start + 1, match_start + 4
+            quote = s[quote_start:quote_end]
+            is_quote = quote[:1].isspace() or (quote[:2] == ">>" and quote[2:].isspace())
+            parts.append("\\>" if is_quote else ">")
+        elif match["bold"] is not None:
+            parts.append(TAG_FORMATS["'''"].format(_fix_markup(s, *match.span("bold_text"))))
+        elif match["br"] is not None:
+            parts.append(TAG_FORMATS["br"])
+        else:
+            parts.append(TAG_FORMATS[match["t"]].format(_fix_markup(s, *match.span("span_text"))))
+        position = match_end
+
+    parts.append(s[position:end])
+    return "".join(parts)
+
+
+@dataclass(frozen=True)
+class ValidationPlan:
+    """Everything the validators of a wiki model need to know about its fields, worked
+    out once when the model class is created rather than on every instance.
+
+    Parameters:
+    -----------
+    propagated_extras: :class:`dict[str, dict[str, Any]]`
+        Per field, the Field extras that are set on its value by :class:`ExtraPropagator`.
+    emoji_fields: :class:`frozenset[str]`
+        The names of all Emoji-typed fields.
+    string_fields: :class:`frozenset[str]`
+        The names of all other fields and annotations, whose string values are fixed up.
+    post_parsed_fields: :class:`tuple[str, ...]`
+        The names of all fields whose values are fixed up again after validation.
+    slot_fields: :class:`tuple[tuple[str, bool, bool], ...]`
+        The alias of every field, along with whether it is slot-dependent and required.
+    """
+
+    propagated_extras: dict[str, dict[str, Any]]
+    emoji_fields: frozenset[str]
+    string_fields: frozenset[str]
+    post_parsed_fields: tuple[str, ...]
+    slot_fields: tuple[tuple[str, bool, bool], ...]
+
+    @classmethod
+    def from_model(cls, model: type[BaseModel]) -> ValidationPlan:
+        fields = model.__fields__
+        propagated_extras = {}
+        for name, field in fields.items():
+            annotations = getattr(field.type_, "__annotations__", None)
+            if annotations is None:
+                continue
+            extras = {k: v for k, v in field.field_info.extra.items() if k in annotations}
+            if extras:
+                propagated_extras[name] = extras
+
+        emoji_fields = frozenset(name for name, field in fields.items() if field.type_ is Emoji)
+        own_annotations = model.__dict__.get("__annotations__", {})
+        return cls(
+            propagated_extras=propagated_extras,
+            emoji_fields=emoji_fields,
+            string_fields=(fields.keys() | own_annotations.keys()) - emoji_fields,
+            post_parsed_fields=tuple(
+                name
+                for name, field in fields.items()
+                if field.field_info.extra.get("parse_post") is True
+            ),
+            slot_fields=tuple(
+                (
+                    field.alias,
+                    bool(field.field_info.extra.get("slot_dependent")),
+                    bool(field.required),
+                )
+                for field in fields.values()
+            ),
+        )
 
 
 class ExtraPropagator(BaseModel):
@@ -457,51 +914,45 @@ class ExtraPropagator(BaseModel):
     Requires some caution such that unwanted propagations do not occur.
     """
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.__validation_plan__ = ValidationPlan.from_model(cls)
+
     @root_validator(allow_reuse=True)
     def propagate_extras(cls, values):
-        for k, v in values.items():
-            field = cls.__fields__[k]
-            if not hasattr(field.type_, "__annotations__"):
-                continue
-            extras = field.field_info.extra
-            for extra_k, extra_v in extras.items():
-                if extra_k in field.type_.__annotations__:
-                    setattr(v, extra_k, extra_v)
+        for k, extras in cls.__validation_plan__.propagated_extras.items():
+            if k in values:
+                for extra_k, extra_v in extras.items():
+                    setattr(values[k], extra_k, extra_v)
         return values
 
 
 class GenericWikiModel(ExtraPropagator):
     @root_validator(pre=True, allow_reuse=True)
     def parse_arguments(cls, values: dict[str, str]):
-        for k, v in values.copy().items():
-            field = cls.__fields__.get(k)
-            if field:
-                if field.type_ is Emoji:
-                    try:
-                        values[k] = Emoji[v]
-                    except AttributeError:
-                        pass
-                    continue
-            elif k not in cls.__annotations__:
-                continue
-
-            if isinstance(v, str):
+        plan = cls.__validation_plan__
+        for k, v in values.items():
+            if k in plan.emoji_fields:
+                try:
+                    values[k] = Emoji[v]
+                except AttributeError:
+                    pass
+            elif k in plan.string_fields and isinstance(v, str):
                 values[k] = cls._fix_string(v)
 
         return values
 
     @root_validator(allow_reuse=True)
     def post_string_parse(cls, values: dict[str:Any]):
-        for k, v in values.items():
-            field = cls.__fields__.get(k)
-            if field.field_info.extra.get("parse_post") is True:
-                values[k] = cls._fix_string(v)
+        for k in cls.__validation_plan__.post_parsed_fields:
+            if k in values:
+                values[k] = cls._fix_string(values[k])
 
         return values
 
     @staticmethod
     def _fix_string(s: str) -> str:
-        return reduce(lambda x, f: f(x), (escape_markdown, resolve_wikilinks, eliminate_tags), s)
+        return fix_markup(s)
 
     def to_embed(self) -> list[Embed]:
         ...
@@ -586,7 +1037,7 @@ class BattlesuitModel(GenericWikiModel):
 
     @validator("core_strengths", pre=True, allow_reuse=True)
     def parse_core_strengths(cls, value):
-        cores = regex.findall("|".join(Emoji.__sortkeys__), value, regex.I)
+        cores = Emoji.__sortkeys_pattern__.findall(value)
         return [Emoji[core] for core in cores]
 
     def to_embed(self) -> list[Embed]:
@@ -671,13 +1122,11 @@ class StigmataModel(GenericWikiModel):
         stig_slot: str = values["slot"].upper()
 
         data = {}
-        for field in cls.__fields__.values():
-            field_name = field.alias
-            slot_dependent = field.field_info.extra.get("slot_dependent")
+        for field_name, slot_dependent, required in cls.__validation_plan__.slot_fields:
             try:
                 data[field_name] = values[stig_slot + field_name if slot_dependent else field_name]
             except KeyError:
-                if field.required:
+                if required:
                     raise
 
         return data
@@ -805,17 +1254,21 @@ class IconMapping(Enum):
     bow = "Bows (Type)"
 
 
+_ACTIVE_SKILL = regex.compile(r".*\[SP: \d+\].*")
+
+
 class WeaponSkillModel(GenericWikiModel):
 
     name: str
     effect: str
 
-    def add_field_to_embed(self, embed: Embed) -> Embed:
-
-        is_active = regex.match(r".*\[SP: \d+\].*", self.effect)
-        icon = (Emoji.ACTIVE if is_active else Emoji.PASSIVE).value
+    @property
+    def icon(self) -> str:
+        is_active = _ACTIVE_SKILL.match(self.effect)
+        return (Emoji.ACTIVE if is_active else Emoji.PASSIVE).value
 
-        return embed.add_field(name=f"{icon} {self.name}", value=self.effect, inline=False)
+    def add_field_to_embed(self, embed: Embed) -> Embed:
+        return embed.add_field(name=f"{self.icon} {self.name}", value=self.effect, inline=False)
 
 
 class WeaponModel(GenericWikiModel):
@@ -1,14 +1,22 @@
 from __future__ import annotations
 
+import bisect
+import itertools
+import math
 import re
+import time
+from collections import Counter, OrderedDict, defaultdict
 from dataclasses import dataclass
-from typing import Callable, TypeVar
+from typing import Callable, Generic, Hashable, Iterator, Optional, TypeVar
 
 
 # Custom classes
 
 
 T = TypeVar("T")
+H = TypeVar("H", bound=Hashable)
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
 
 
 class defaultlist(list[T]):
@@ -90,6 +98,239 @@ class sortedlist(list[T]):
                 print("wat")
 
 
+class LRUCache(OrderedDict[K, V]):
+    """Dict that holds at most `maxsize` items. When full, setting a new item evicts
+    the least recently used item.
+
+    Parameters:
+    -----------
+    maxsize: :class:`int`
+        The maximum number of items held by the cache.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key: K) -> V:
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class TTLCache(LRUCache[K, V]):
+    """LRU cache whose items expire `ttl` seconds after they were last set or touched.
+    Expired items are treated as missing.
+
+    Parameters:
+    -----------
+    maxsize: :class:`int`
+        The maximum number of items held by the cache.
+    ttl: :class:`float`
+        The number of seconds after which an item expires.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 3600):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self._timestamps: dict[K, float] = {}
+
+    def __getitem__(self, key: K) -> V:
+        if self.age(key) > self.ttl:
+            del self[key]
+            raise KeyError(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self._timestamps[key] = time.monotonic()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: K) -> None:
+        super().__delitem__(key)
+        del self._timestamps[key]
+
+    def __contains__(self, key: object) -> bool:
+        return super().__contains__(key) and self.age(key) <= self.ttl
+
+    def popitem(self, last: bool = True) -> tuple[K, V]:
+        key, value = super().popitem(last=last)
+        del self._timestamps[key]
+        return key, value
+
+    def pop(self, key: K, *default: V) -> V:
+        self._timestamps.pop(key, None)
+        return super().pop(key, *default)
+
+    def clear(self) -> None:
+        super().clear()
+        self._timestamps.clear()
+
+    def age(self, key: K) -> float:
+        """The number of seconds since the item was last set or touched."""
+        return time.monotonic() - self._timestamps[key]
+
+    def touch(self, key: K) -> None:
+        """Reset the age of an item, if present, without changing its value."""
+        if key in self._timestamps:
+            self._timestamps[key] = time.monotonic()
+
+
+class NgramIndex(Generic[H]):
+    """Inverted index from character n-grams to the string keys they occur in, used to
+    fuzzily match a query against many keys at once. Only keys that share at least one
+    n-gram with the query are ever scored.
+
+    Keys are padded with a dash on both sides, such that the start and end of a key
+    form n-grams of their own. Every key can be associated with any number of values.
+
+    Parameters:
+    -----------
+    n: :class:`int`
+        The size of the n-grams. Defaults to 3 (trigrams).
+    """
+
+    def __init__(self, n: int = 3):
+        self.n = n
+        self._postings: defaultdict[str, set[str]] = defaultdict(set)
+        self._grams: dict[str, Counter[str]] = {}
+        self._norms: dict[str, float] = {}
+        self._values: defaultdict[str, set[H]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._grams)
+
+    def ngrams(self, s: str) -> Counter[str]:
+        padded = f"-{s}-"
+        return Counter("".join(gram) for gram in zip(*(padded[i:] for i in range(self.n))))
+
+    def add(self, key: str, value: H) -> None:
+        """Add a value to the index under the given key."""
+        if key not in self._grams:
+            grams = self._grams[key] = self.ngrams(key)
+            self._norms[key] = math.sqrt(sum(count**2 for count in grams.values()))
+            for gram in grams:
+                self._postings[gram].add(key)
+
+        self._values[key].add(value)
+
+    def remove(self, key: str, value: H) -> None:
+        """Remove a value from the index. The key itself is removed as soon as it no
+        longer holds any values.
+        """
+        values = self._values.get(key)
+        if values is None:
+            return
+
+        values.discard(value)
+        if values:
+            return
+
+        del self._values[key], self._norms[key]
+        for gram in self._grams.pop(key):
+            self._postings[gram].discard(key)
+            if not self._postings[gram]:
+                del self._postings[gram]
+
+    def search(self, query: str) -> Iterator[tuple[float, H]]:
+        """Yield the cosine similarity between the n-grams of the query and those of
+        each candidate key, along with every value stored under that key. Keys that do
+        not share any n-grams with the query are never considered.
+        """
+        query_grams = self.ngrams(query)
+        if not query_grams:
+            return
+
+        dots: defaultdict[str, int] = defaultdict(int)
+        for gram, count in query_grams.items():
+            for key in self._postings.get(gram, ()):
+                dots[key] += count * self._grams[key][gram]
+
+        query_norm = math.sqrt(sum(count**2 for count in query_grams.values()))
+        for key, dot in dots.items():
+            score = dot / (query_norm * self._norms[key])
+            for value in self._values[key]:
+                yield score, value
+
+
+class SubstringIndex(Generic[H]):
+    """Suffix array over string keys, used to find all keys containing a query as a
+    substring with a binary search. Every key can be associated with any number of
+    values.
+
+    Matches are ranked by where in the key the query was found: prefixes of the key
+    come first, then prefixes of any of its words, then any other substring. Ties are
+    broken in favour of shorter keys.
+    """
+
+    def __init__(self):
+        self._suffixes: list[tuple[str, int, str]] = []  # (suffix, offset, key)
+        self._values: defaultdict[str, set[H]] = defaultdict(set)
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, key: str, value: H) -> None:
+        """Add a value to the index under the given key."""
+        if key not in self._values:
+            self._suffixes.extend((key[offset:], offset, key) for offset in range(len(key)))
+            self._dirty = True
+
+        self._values[key].add(value)
+
+    def remove(self, key: str, value: H) -> None:
+        """Remove a value from the index. The key itself is removed as soon as it no
+        longer holds any values.
+        """
+        values = self._values.get(key)
+        if values is None:
+            return
+
+        values.discard(value)
+        if not values:
+            del self._values[key]
+            self._suffixes = [suffix for suffix in self._suffixes if suffix[2] != key]
+
+    def search(self, query: str) -> Iterator[tuple[tuple[int, int], H]]:
+        """Yield a rank (lower is better) along with every value stored under each key
+        that contains the query. Values may be yielded more than once if the query
+        occurs in their key multiple times.
+        """
+        if self._dirty:
+            self._suffixes.sort()  # mostly-sorted data, so this is cheap
+            self._dirty = False
+
+        start = bisect.bisect_left(self._suffixes, (query,))
+        for suffix, offset, key in itertools.islice(self._suffixes, start, None):
+            if not suffix.startswith(query):
+                break
+
+            rank = self.rank(key, offset)
+            for value in self._values[key]:
+                yield rank, value
+
+    @staticmethod
+    def rank(key: str, offset: int) -> tuple[int, int]:
+        """Rank a match at the given offset in the key, as used by :meth:`search`."""
+        if not offset:
+            return (0, len(key))
+        elif not key[offset - 1].isalnum():
+            return (1, len(key))
+        return (2, len(key))
+
+
 class Codeblock:
     def __init__(self, content: str, *, lang: str = None):
         if lang is not None:
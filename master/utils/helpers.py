@@ -1,18 +1,25 @@
 import disnake
 from disnake.ext import commands
 
+import asyncio
+import functools
+import inspect
 import os
 import re
 import sys
 from collections.abc import Mapping
-from itertools import groupby
+from itertools import groupby, islice
 from os import walk
-from typing import Any, Optional
+from typing import Any, Callable, Hashable, Iterable, Iterator, Optional, TypeVar
+from utils.classes import LRUCache
 
 MAIN_DIR = os.path.dirname(sys.modules["__main__"].__file__)
 
 DEFAULT_EXT_DIR_BLACKLIST = r"__.*"
 DEFAULT_EXT_FILE_BLACKLIST = r"__.*"
+AUTOCOMPLETE_MAX_USERS = 1024
+
+T = TypeVar("T")
 
 
 def all_equal(iterable):
@@ -21,6 +28,13 @@ def all_equal(iterable):
     return next(g, True) and not next(g, False)
 
 
+def chunked(iterable: Iterable[T], n: int) -> Iterator[list[T]]:
+    "Yields successive lists of (at most) n elements from iterable"
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, n)):
+        yield chunk
+
+
 def deep_update(D: dict, U: dict, *, update_None: bool = True, update_falsy: bool = True) -> dict:
     """Update nested dict D with keys and values from nested dict U.
     Much like Python's built-in :method:`update`, this is done in-place.
@@ -117,3 +131,82 @@ def get_role_by_name(name: str, guild: disnake.Guild) -> Optional[disnake.Role]:
         if role.name.lower() == name.lower():
             return role
     return None
+
+
+def filter_choices(cog: Any, inp: str, choices: Iterable[str]) -> list[str]:
+    """Refines cached autocomplete choices for any autocompleter that returns all choices
+    containing the (case-insensitive) input. See :func:`cached_autocomplete`.
+    """
+    return [choice for choice in choices if inp in choice.lower()]
+
+
+def cached_autocomplete(
+    maxsize: int = 128,
+    *,
+    scope: Optional[Callable[[Any, disnake.ApplicationCommandInteraction], Hashable]] = None,
+    refine: Optional[Callable[[Any, str, Any], Any]] = None,
+):
+    """Decorator for cog autocomplete functions that caches their results in an LRU
+    cache keyed by the (lowercased) input, and drops keystrokes that have already been
+    superseded by a newer keystroke from the same user by not responding to them.
+
+    Parameters
+    ----------
+    maxsize: :class:`int`
+        the maximum number of cached results.
+    scope: Optional[Callable[[Cog, Interaction], Hashable]]
+        a function whose result is included in the cache key. Use this for anything the
+        results depend on other than the input, such as the user or the version of the
+        data that is autocompleted from; results for any other scope are never reused.
+    refine: Optional[Callable[[Cog, str, Choices], Optional[Choices]]]
+        a function that derives the choices for an input from the cached choices of a
+        prefix of that input, or returns `None` if that is not possible. Only the
+        longest cached prefix is tried. See :func:`filter_choices`.
+    """
+
+    def decorator(func):
+        cache = LRUCache(maxsize)
+        latest = LRUCache(AUTOCOMPLETE_MAX_USERS)  # user id -> latest interaction id
+        signature = inspect.signature(func)
+
+        async def run(cog, inter: disnake.ApplicationCommandInteraction, inp: str, **kwargs):
+            user_id = inter.author.id
+            if inter.id < latest.get(user_id, 0):
+                return None
+            latest[user_id] = inter.id
+
+            await asyncio.sleep(0)  # Give newer keystrokes a chance to come in first
+            if latest.get(user_id) != inter.id:
+                return None
+
+            inp_key = inp.lower()
+            scope_key = (scope(cog, inter) if scope else None, tuple(sorted(kwargs.items())))
+
+            choices = cache.get((scope_key, inp_key))
+            if choices is None and refine:
+                for i in range(len(inp_key) - 1, -1, -1):
+                    cached = cache.get((scope_key, inp_key[:i]))
+                    if cached is not None:
+                        choices = refine(cog, inp_key, cached)
+                        break
+
+            if choices is None:
+                choices = func(cog, inter, inp, **kwargs)
+                if inspect.isawaitable(choices):
+                    choices = await choices
+                if latest.get(user_id) != inter.id:
+                    return None
+
+            cache[(scope_key, inp_key)] = choices
+            return choices
+
+        @functools.wraps(func)
+        def wrapper(cog, inter: disnake.ApplicationCommandInteraction, inp: str, **kwargs):
+            # Bind eagerly such that a TypeError for unexpected kwargs is raised on call,
+            # as disnake relies on this to retry the call without any filled options.
+            signature.bind(cog, inter, inp, **kwargs)
+            return run(cog, inter, inp, **kwargs)
+
+        return wrapper
+
+    return decorator
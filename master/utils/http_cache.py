@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional
+import aiohttp
+from utils.classes import LRUCache
+
+__all__ = ("CachedResponse", "ResponseCache")
+
+logger = logging.getLogger("http_cache")
+
+
+@dataclass
+class CachedResponse:
+    """The body of a response, along with what is needed to tell whether it is still
+    fresh, and to revalidate it with the server once it is not.
+
+    Parameters:
+    -----------
+    body: :class:`bytes`
+        The raw response body.
+    expires: :class:`float`
+        The unix time after which the response has to be revalidated.
+    etag: Optional[:class:`str`]
+        The ETag of the response, if any.
+    last_modified: Optional[:class:`str`]
+        The Last-Modified header of the response, if any.
+    """
+
+    body: bytes
+    expires: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str], body: bytes) -> Optional[CachedResponse]:
+        """Create a cache entry from the headers of a response, or return `None` if the
+        response cannot be cached, or would never be of any use.
+        """
+        directives = parse_cache_control(headers.get("Cache-Control", ""))
+        if "no-store" in directives:
+            return None
+
+        response = cls(
+            body=body,
+            expires=0,
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+        )
+        response.refresh(headers)
+        if response.expires <= time.time() and not (response.etag or response.last_modified):
+            return None
+        return response
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires
+
+    def refresh(self, headers: Mapping[str, str]) -> None:
+        """Update the freshness of the response with the headers of a new response to the
+        same request, such as a 304 Not Modified.
+        """
+        directives = parse_cache_control(headers.get("Cache-Control", ""))
+        max_age = 0
+        if "no-cache" not in directives:
+            try:
+                max_age = int(directives.get("max-age", 0))
+            except ValueError:
+                pass
+        self.expires = time.time() + max_age
+        self.etag = headers.get("ETag", self.etag)
+        self.last_modified = headers.get("Last-Modified", self.last_modified)
+
+    def conditional_headers(self) -> dict[str, str]:
+        """Headers that ask the server to only send the response if it changed."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+    def dump(self) -> dict[str, Any]:
+        return {
+            "body": self.body.decode(),
+            "expires": self.expires,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+        }
+
+    @classmethod
+    def load(cls, data: dict[str, Any]) -> CachedResponse:
+        return cls(**{**data, "body": data["body"].encode()})
+
+
+def parse_cache_control(value: str) -> dict[str, str]:
+    """Parse a Cache-Control header into a dict of directives to their (possibly empty)
+    values.
+    """
+    directives = {}
+    for directive in value.split(","):
+        name, _, argument = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"')
+    return directives
+
+
+class ResponseCache:
+    """HTTP cache for GET requests that return JSON. Responses are kept in memory, and
+    optionally on disk such that they survive restarts. Fresh responses are served
+    without making a request; stale responses are revalidated through conditional
+    requests, such that unchanged responses only cost a 304 Not Modified.
+
+    Responses are keyed on the url and the normalized query parameters.
+
+    Stored responses are pruned on startup and after every so many writes: responses that
+    weren't stored or revalidated for `max_age` seconds are removed, and then the least
+    recently stored responses until at most `max_files` remain.
+
+    Parameters:
+    -----------
+    directory: Optional[:class:`str`]
+        The directory to store responses in. If `None`, responses are only kept in memory.
+    maxsize: :class:`int`
+        The maximum number of responses kept in memory.
+    max_files: :class:`int`
+        The maximum number of responses kept on disk.
+    max_age: :class:`float`
+        The number of seconds a response is kept on disk after it was last stored.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        maxsize: int = 512,
+        *,
+        max_files: int = 4096,
+        max_age: float = 7 * 24 * 60 * 60,
+    ):
+        self.directory = directory
+        self.memory: LRUCache[str, CachedResponse] = LRUCache(maxsize)
+        self.max_files = max(max_files, 1)
+        self.max_age = max_age
+        self.hits = self.revalidations = self.misses = 0
+        self._writes = 0
+        self.prune()
+
+    @staticmethod
+    def key(url: str, params: Mapping[str, Any]) -> str:
+        normalized = sorted((str(k), str(v)) for k, v in params.items())
+        return hashlib.sha1(json.dumps([url, normalized]).encode()).hexdigest()
+
+    async def get_json(
+        self, session: aiohttp.ClientSession, url: str, params: Mapping[str, Any]
+    ) -> Any:
+        """Get the decoded JSON response to a GET request, from cache if possible."""
+        key = self.key(url, params)
+        cached = self.get(key)
+        if cached is not None and cached.is_fresh:
+            self.hits += 1
+            return cached.json()
+
+        headers = cached.conditional_headers() if cached is not None else {}
+        async with session.get(url, params=params, headers=headers) as resp:
+            if resp.status == 304 and cached is not None:
+                self.revalidations += 1
+                cached.refresh(resp.headers)
+                self.set(key, cached)
+                return cached.json()
+
+            self.misses += 1
+            body = await resp.read()
+            response = CachedResponse.from_headers(resp.headers, body)
+            if resp.status == 200 and response is not None:
+                self.set(key, response)
+
+        return json.loads(body)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        response = self.memory.get(key)
+        if response is None and self.directory is not None:
+            try:
+                with open(self.path(key)) as file:
+                    response = CachedResponse.load(json.load(file))
+            except (OSError, ValueError, KeyError, TypeError):
+                return None
+            self.memory[key] = response
+        return response
+
+    def set(self, key: str, response: CachedResponse) -> None:
+        self.memory[key] = response
+        if self.directory is None:
+            return
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = self.path(key) + ".tmp"
+            with open(temp_path, "w") as file:
+                json.dump(response.dump(), file)
+            os.replace(temp_path, self.path(key))
+        except OSError as e:
+            logger.warning(f"Could not store cached response {key}: {e}")
+            return
+
+        self._writes += 1
+        if self._writes % max(self.max_files // 4, 1) == 0:
+            self.prune()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def prune(self) -> None:
+        """Remove stored responses that are too old, and then the least recently stored
+        ones while there are too many. Responses that are removed from disk stay in memory
+        for as long as the memory cache keeps them.
+        """
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+
+        files: list[tuple[float, str]] = []
+        for name in os.listdir(self.directory):
+            if name.endswith((".json", ".tmp")):
+                path = os.path.join(self.directory, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass  # Removed in the meantime
+
+        files.sort(reverse=True)
+        cutoff = time.time() - self.max_age
+        removed = [
+            path for i, (mtime, path) in enumerate(files) if mtime < cutoff or i >= self.max_files
+        ]
+        for path in removed:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove cached response {path}: {e}")
+        if removed:
+            logger.info(f"Pruned {len(removed)} of {len(files)} cached responses.")
+
+    def clear(self) -> None:
+        """Remove all responses, from memory as well as from disk."""
+        self.memory.clear()
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
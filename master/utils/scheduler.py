@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import AsyncIterator, Optional
+
+__all__ = ("Priority", "RequestScheduler")
+
+
+class Priority(IntEnum):
+    """Priority classes of outgoing requests; lower values are served first."""
+
+    INTERACTIVE = 0  # Someone is waiting on the response
+    REFRESH = 1  # Keeping indexes up to date
+    BACKGROUND = 2  # Warming up caches
+
+
+@dataclass
+class PriorityStats:
+    requests: int = 0
+    waiting: int = 0
+    total_wait: float = 0
+    max_wait: float = 0
+
+    @property
+    def mean_wait(self) -> float:
+        return self.total_wait / self.requests if self.requests else 0
+
+
+class RequestScheduler:
+    """Schedules outgoing requests by priority, within a limit on the number of requests
+    per second and the number of concurrent requests. Requests of the same priority are
+    served in order of arrival.
+
+    Requests that aren't interactive may not use the last concurrency slot nor the last
+    token of the rate limit, such that an interactive request never has to wait for
+    requests of lower priority to finish.
+
+    Parameters:
+    -----------
+    rate: :class:`float`
+        The number of requests per second that is allowed on average. With 0 or less,
+        the rate is unlimited.
+    burst: :class:`int`
+        The number of requests that may be made at once after a quiet period.
+    concurrency: :class:`int`
+        The maximum number of requests that may be in flight at any time.
+    """
+
+    def __init__(self, rate: float, *, burst: int = 1, concurrency: int = 4):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.concurrency = max(concurrency, 1)
+        self.tokens = float(self.burst)
+        self.active = 0
+        self.stats = {priority: PriorityStats() for priority in Priority}
+        self._updated = time.monotonic()
+        self._waiters: list[tuple[Priority, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @asynccontextmanager
+    async def request(self, priority: Priority = Priority.INTERACTIVE) -> AsyncIterator[None]:
+        """Wait for a request of the given priority to be allowed, and hold its slot for
+        the duration of the context.
+        """
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE) -> None:
+        stats = self.stats[priority]
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        stats.waiting += 1
+        start = time.monotonic()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # The slot was granted right before the cancellation
+            raise
+        finally:
+            stats.waiting -= 1
+
+        wait = time.monotonic() - start
+        stats.requests += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+
+    def release(self) -> None:
+        self.active -= 1
+        self._dispatch()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(stats.waiting for stats in self.stats.values())
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _dispatch(self) -> None:
+        """Grant as many waiting requests as the limits allow, in order of priority. If
+        the rate limit is what holds the next request back, try again once it allows it.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        self._refill()
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():  # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+
+            reserved = 0 if priority is Priority.INTERACTIVE else 1
+            if self.active >= self.concurrency - min(reserved, self.concurrency - 1):
+                return  # Dispatched again on release
+            if self.rate > 0:
+                needed = 1 + min(reserved, self.burst - 1)
+                if self.tokens < needed:
+                    delay = (needed - self.tokens) / self.rate
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                    return
+                self.tokens -= 1
+
+            heapq.heappop(self._waiters)
+            self.active += 1
+            future.set_result(None)
+
+    def describe(self) -> str:
+        """Describe the current state of the scheduler, for diagnostics."""
+        lines = [f"active: {self.active}/{self.concurrency}, tokens: {self.tokens:.1f}"]
+        for priority, stats in self.stats.items():
+            lines.append(
+                f"{priority.name.lower():>11}: {stats.waiting} waiting, {stats.requests} served, "
+                f"wait {stats.mean_wait * 1000:.0f} ms mean / {stats.max_wait * 1000:.0f} ms max"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import re
+from typing import Iterator, Optional
+
+__all__ = ("extract_template_arguments",)
+
+
+# Tags whose contents are parsed as wikitext, but separately from the rest of the page.
+PARSABLE_TAGS = (
+    "categorytree|gallery|imagemap|includeonly|indicator|inputbox|noinclude|onlyinclude|"
+    "poem|ref|references|section"
+)
+# Tags whose contents are not wikitext at all.
+UNPARSABLE_TAGS = (
+    "ce|charinsert|chem|graph|hiero|languages|mapframe|maplink|math|nowiki|pagelist|pages|"
+    "pagequality|pre|score|source|syntaxhighlight|templatedata|templatestyles|timeline"
+)
+# Magic words that turn a template into a parser function, when followed by a colon.
+PARSER_FUNCTIONS = """
+    ARTICLEPAGENAME ARTICLEPAGENAMEE ARTICLESPACE ARTICLESPACEE BASEPAGENAME
+    BASEPAGENAMEE CASCADINGSOURCES CONTENTLANG CONTENTLANGUAGE CURRENTDAY CURRENTDAY2
+    CURRENTDAYNAME CURRENTDOW CURRENTHOUR CURRENTMONTH CURRENTMONTH1 CURRENTMONTHABBREV
+    CURRENTMONTHNAME CURRENTMONTHNAMEGEN CURRENTTIME CURRENTTIMESTAMP CURRENTVERSION
+    CURRENTWEEK CURRENTYEAR DEFAULTCATEGORYSORT DEFAULTSORT DEFAULTSORTKEY DIRECTIONMARK
+    DIRMARK DISPLAYTITLE FULLPAGENAME FULLPAGENAMEE LOCALDAY LOCALDAY2 LOCALDAYNAME
+    LOCALDOW LOCALHOUR LOCALMONTH LOCALMONTH1 LOCALMONTHABBREV LOCALMONTHNAME
+    LOCALMONTHNAMEGEN LOCALTIME LOCALTIMESTAMP LOCALWEEK LOCALYEAR NAMESPACE NAMESPACEE
+    NAMESPACENUMBER NUMBERINGROUP NUMBEROFACTIVEUSERS NUMBEROFADMINS NUMBEROFARTICLES
+    NUMBEROFEDITS NUMBEROFFILES NUMBEROFPAGES NUMBEROFUSERS NUMBEROFVIEWS NUMINGROUP
+    PAGEID PAGELANGUAGE PAGENAME PAGENAMEE PAGESINCAT PAGESINCATEGORY PAGESINNAMESPACE
+    PAGESINNS PAGESIZE PROTECTIONEXPIRY PROTECTIONLEVEL REVISIONDAY REVISIONDAY2
+    REVISIONID REVISIONMONTH REVISIONMONTH1 REVISIONTIMESTAMP REVISIONUSER REVISIONYEAR
+    ROOTPAGENAME ROOTPAGENAMEE SCRIPTPATH SERVER SERVERNAME SITENAME STYLEPATH
+    SUBJECTPAGENAME SUBJECTPAGENAMEE SUBJECTSPACE SUBJECTSPACEE SUBPAGENAME SUBPAGENAMEE
+    TALKPAGENAME TALKPAGENAMEE TALKSPACE TALKSPACEE anchorencode canonicalurl filepath
+    formatnum fullurl gender grammar int lc lcfirst localurl msg msgnw ns nse padleft
+    padright plural raw safesubst subst uc ucfirst urlencode
+""".split()
+
+# Constructs are found from the inside out; every construct that is found is masked out
+# of a "shadow" copy of the wikitext, such that the construct around it can be found in
+# the next pass. Links are masked with a character that is invalid in titles, such that
+# a template with a link in its name is not mistaken for a valid template.
+COMMENT_MASK = "\0"
+LINK_MASK = "\x02"
+
+_TAGS = re.compile(
+    r"<(?:(?P<comment>!--.*?(?:-->|\Z))"
+    rf"|(?P<unparsable>(?P<u>{UNPARSABLE_TAGS})(?=[\s>/])[^>]*(?:(?<=/)>|>.*?</(?P=u)\s*>))"
+    rf"|(?P<parsable>(?P<p>{PARSABLE_TAGS})(?=[\s>/])[^>]*(?:(?<=/)>|>.*?</(?P=p)\s*>)))",
+    re.S | re.I,
+)
+_LINKS = re.compile(rf"\[\[[^|{{}}\[\]<>\r\n{LINK_MASK}]*(?:\|[^\[\]]*)?\]\]")
+_PARAMETERS = re.compile(
+    r"\{\{\{(?!\}\}\})[^{}]*(?:(?:(?<!\})\}(?!\})|(?<!\{)\{(?!\{))[^{}]*)*\}\}\}"
+)
+_WHITESPACE = rf"[ \t\n\r\f\v{COMMENT_MASK}]*"
+# The lookahead and backreference keep the engine from backtracking into the leading run
+# of text when a template turns out to contain another template.
+_TEMPLATES = re.compile(r"\{\{(?=([^{}]*))\1(?:(?:\{(?!\{)|\}(?!\}))[^{}]*)*\}\}")
+_NAME = re.compile(
+    rf"(?P<function>{_WHITESPACE}(?:#[^{{}}\s:|]+|{'|'.join(PARSER_FUNCTIONS)})(?::|\Z))"
+    rf"|(?P<blank>[ \t\n\r\f\v{COMMENT_MASK}_]*(?:\||\Z))"
+    rf"|(?P<template>{_WHITESPACE}[^|{{}}\[\]<>\r\n{LINK_MASK}]*{_WHITESPACE}(?:\||\Z))"
+)
+_PARSABLE_MARKUP = str.maketrans({char: "_" for char in "=|[]'{}"})
+
+
+def _find_constructs(wikitext: str) -> list[tuple[int, int, Optional[str]]]:
+    """Find the spans of all templates, parser functions, links, parameters, comments
+    and tags in the wikitext, sorted by position. Templates are accompanied by their
+    shadow, in which anything nested in them is masked out.
+    """
+    spans: list[tuple[int, int, Optional[str]]] = []
+    found_templates = True
+
+    def mask_tag(match: re.Match) -> str:
+        spans.append((*match.span(), None))
+        if match["comment"]:
+            return COMMENT_MASK * len(match[0])
+        elif match["unparsable"]:
+            return "_" * len(match[0])
+        return match[0].translate(_PARSABLE_MARKUP)
+
+    def mask_link(match: re.Match) -> str:
+        spans.append((*match.span(), None))
+        return LINK_MASK * len(match[0])
+
+    def mask_parameter(match: re.Match) -> str:
+        spans.append((*match.span(), None))
+        return "_" * len(match[0])
+
+    def mask_template(match: re.Match) -> str:
+        nonlocal found_templates
+        masked = mask_braces(match.start(), match[0])
+        found_templates = found_templates or masked != match[0]
+        return masked
+
+    def mask_braces(start: int, braces: str) -> str:
+        """Mask a pair of double braces that has no other double braces inside of it."""
+        name = _NAME.match(braces, 2, len(braces) - 2)
+        if name is None:
+            if braces.startswith("{{{"):  # Could still be a template in a run of braces
+                return "{" + mask_braces(start + 1, braces[1:])
+            return braces
+        elif name["blank"] is not None:  # Not a template, but its braces are used up
+            return "_{" + "_" * (len(braces) - 2)
+
+        spans.append((start, start + len(braces), braces if name["template"] else None))
+        return "X" * len(braces)
+
+    shadow = _TAGS.sub(mask_tag, wikitext)
+    while found_templates:
+        found_templates = False
+        found = True
+        while found and ("[[" in shadow or "{{{" in shadow):
+            shadow, found_links = _LINKS.subn(mask_link, shadow)
+            shadow, found_parameters = _PARAMETERS.subn(mask_parameter, shadow)
+            found = found_links or found_parameters
+        if "{{" in shadow:
+            shadow = _TEMPLATES.sub(mask_template, shadow)
+
+    spans.sort(key=lambda span: (span[0], -span[1]))
+    return spans
+
+
+def _template_arguments(wikitext: str, start: int, shadow: str) -> Iterator[tuple[str, str]]:
+    """Get the arguments of the template at `start`. Only the pipes and equals signs
+    that are left in its shadow separate arguments.
+    """
+    name, *arguments = shadow[2:-2].split("|")
+    position = 0
+    argument_start = start + 2 + len(name) + 1
+    for argument in arguments:
+        argument_end = argument_start + len(argument)
+        text = wikitext[argument_start:argument_end]
+        equals = argument.find("=")
+        if equals == -1:
+            position += 1
+            yield str(position), text.strip()
+        else:
+            yield text[:equals].strip(), text[equals:][1:].strip()
+        argument_start = argument_end + 1
+
+
+def extract_template_arguments(wikitext: str) -> dict[str, str]:
+    """Collect the arguments of all top-level templates in the given wikitext. Templates
+    nested in other templates, parser functions, links, parameters, comments or tags
+    are ignored. In case an argument occurs more than once, the last one wins.
+
+    Parameters:
+    -----------
+    wikitext: :class:`str`
+        The wikitext to extract template arguments from.
+
+    Returns:
+    --------
+    :class:`dict[str, str]`
+        A mapping of stripped argument names, or positions for unnamed arguments, to
+        their stripped values.
+    """
+    arguments = {}
+    top_level_end = 0
+    for start, end, shadow in _find_constructs(wikitext):
+        if start < top_level_end:
+            continue  # Nested in the previous top-level construct
+        top_level_end = end
+        if shadow is not None:
+            arguments.update(_template_arguments(wikitext, start, shadow))
+    return arguments